@@ -0,0 +1,197 @@
+import datetime
+import functools
+import json
+import os
+import sqlite3
+import threading
+
+# Path of the SQLite file backing the persistent cache.
+# Persistence is off until enable_persistent_cache() is called, so library callers
+# (and the tests) never write to disk unless they opt in.
+# Values are stored as JSON, never pickled: a cache file is data, and reading one
+# planted by someone else must not be able to run code.
+_cache_path = None
+_lock = threading.Lock()
+
+def default_cache_path():
+    """
+    Returns the per-user location of the cache file, outside of any project directory.
+    """
+    cache_home = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "notionate", "cache.sqlite")
+
+def _encode_default(value):
+    """
+    Encodes the values YAML produces that JSON has no type for.
+    """
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"__date__": value.isoformat()}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _decode_object(obj):
+    """
+    Restores the values encoded by _encode_default.
+    """
+    if len(obj) == 1:
+        if "__datetime__" in obj:
+            return datetime.datetime.fromisoformat(obj["__datetime__"])
+        if "__date__" in obj:
+            return datetime.date.fromisoformat(obj["__date__"])
+    return obj
+
+def _dumps(value):
+    """
+    Serializes a cache value to JSON text.
+    """
+    return json.dumps(value, default=_encode_default)
+
+def _loads(data):
+    """
+    Parses a cache value from JSON text.
+    """
+    return json.loads(data, object_hook=_decode_object)
+
+def _restores(original, restored):
+    """
+    Checks that a value read back from JSON is the value that was written.
+    JSON turns tuples into lists, which is accepted, but also turns non-string keys into
+    strings, which is not: such values are not cached at all.
+    """
+    if isinstance(original, (list, tuple)):
+        return (
+            isinstance(restored, list) and len(original) == len(restored)
+            and all(_restores(o, r) for o, r in zip(original, restored))
+        )
+    if isinstance(original, dict):
+        return (
+            isinstance(restored, dict) and len(original) == len(restored)
+            and all(key in restored and _restores(value, restored[key]) for key, value in original.items())
+        )
+    return type(original) is type(restored) and original == restored
+
+def enable_persistent_cache(path):
+    """
+    Enables the persistent cache, stored in a SQLite file at `path`.
+    Raises OSError or sqlite3.Error when the file cannot be created or written.
+    """
+    global _cache_path
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with _lock:
+        conn = sqlite3.connect(path)
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache ("
+                    "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, "
+                    "PRIMARY KEY (namespace, key))"
+                )
+        finally:
+            conn.close()
+        _cache_path = path
+
+def disable_persistent_cache():
+    """
+    Disables the persistent cache. The SQLite file is left in place.
+    """
+    global _cache_path
+    with _lock:
+        _cache_path = None
+
+def _execute(query, params):
+    """
+    Runs one statement against the cache file and returns its first row, if any.
+    The cache is only an optimization, so SQLite errors (e.g. the file was removed during
+    the run) are treated as misses. Must be called with _lock held.
+    """
+    try:
+        conn = sqlite3.connect(_cache_path)
+    except sqlite3.Error:
+        return None
+    try:
+        with conn:
+            return conn.execute(query, params).fetchone()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+def cache_get(namespace, key):
+    """
+    Returns the value cached under `key` in `namespace`, or None on a miss, on an
+    unreadable entry, or when the persistent cache is disabled.
+    """
+    with _lock:
+        if _cache_path is None:
+            return None
+        row = _execute("SELECT value FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+    if row is None:
+        return None
+    try:
+        return _loads(row[0])
+    except (TypeError, ValueError):
+        # Entries written in another format are treated as misses and overwritten
+        return None
+
+def cache_set(namespace, key, value):
+    """
+    Stores `value` under `key` in `namespace`. Does nothing when the persistent cache is disabled
+    or when `value` cannot be stored as JSON.
+    """
+    try:
+        data = _dumps(value)
+    except (TypeError, ValueError):
+        return
+    _store(namespace, key, data)
+
+def _store(namespace, key, data):
+    """
+    Writes already serialized data under `key` in `namespace`.
+    """
+    with _lock:
+        if _cache_path is None:
+            return
+        _execute("INSERT OR REPLACE INTO cache (namespace, key, value) VALUES (?, ?, ?)", (namespace, key, data))
+
+def cache_delete(namespace, key):
+    """
+    Removes `key` from `namespace`, if present.
+    """
+    with _lock:
+        if _cache_path is None:
+            return
+        _execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+
+def cached_by_file(namespace):
+    """
+    Decorator caching the result of `func(path)` in the persistent cache.
+    Entries are keyed by the file's absolute path and are only reused while the file's
+    modification time and size are unchanged, so edited files are parsed again.
+    Results that would not survive a JSON round trip unchanged are not cached.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(path):
+            if _cache_path is None:
+                return func(path)
+
+            stat = os.stat(path)
+            key = os.path.abspath(path)
+            cached = cache_get(namespace, key)
+            if cached is not None and cached[:2] == [stat.st_mtime_ns, stat.st_size]:
+                return cached[2]
+
+            value = func(path)
+            entry = [stat.st_mtime_ns, stat.st_size, value]
+            try:
+                data = _dumps(entry)
+            except (TypeError, ValueError):
+                return value
+            if _restores(entry, _loads(data)):
+                _store(namespace, key, data)
+            return value
+        return wrapper
+    return decorator
@@ -0,0 +1,70 @@
+import time
+
+import httpx
+import notion_client
+from notion_client import APIErrorCode, APIResponseError
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# How many times a rate limited request is retried before the error is raised.
+RATE_LIMIT_RETRIES = 5
+
+# Longest wait (in seconds) between two attempts of a rate limited request.
+MAX_RETRY_DELAY = 30
+
+def _retry_delay(error, attempt):
+    """
+    Returns how long to wait before retrying a rate limited request.
+    Notion says how long to wait in the Retry-After header; without it the wait doubles each time.
+    """
+    try:
+        delay = float(error.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        delay = 2 ** attempt
+    return min(max(delay, 0), MAX_RETRY_DELAY)
+
+class NotionClient(notion_client.Client):
+    """
+    A Notion client that encodes request bodies and decodes responses with orjson.
+    Block lists, query results and schema updates can hold thousands of objects, and orjson
+    handles them several times faster than the stdlib json module. Every API call goes through
+    these two methods, so all payloads use it; without orjson the stock encoding is used.
+    Unlike notion_client.Client, requests rejected as rate limited are retried after a backoff.
+    """
+
+    def request(self, *args, **kwargs):
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            try:
+                return super().request(*args, **kwargs)
+            except APIResponseError as e:
+                if e.code != APIErrorCode.RateLimited or attempt == RATE_LIMIT_RETRIES:
+                    raise
+                time.sleep(_retry_delay(e, attempt))
+
+    def _build_request(self, method, path, query=None, body=None, *args, **kwargs):
+        # Per-request auth and form uploads (depending on the notion_client version) keep
+        # the stock request building
+        if orjson is None or body is None or any(args) or any(kwargs.values()):
+            return super()._build_request(method, path, query, body, *args, **kwargs)
+
+        # Same request logging as the stock implementation
+        self.logger.info(f"{method} {self.client.base_url}{path}")
+        self.logger.debug(f"=> {query} -- {body}")
+        return self.client.build_request(
+            method,
+            path,
+            params=query,
+            content=orjson.dumps(body),
+            headers=httpx.Headers({"Content-Type": "application/json"}),
+        )
+
+    def _parse_response(self, response):
+        if orjson is None or response.is_error:
+            # Error responses go through the stock handling to raise the right exception
+            return super()._parse_response(response)
+        body = orjson.loads(response.content)
+        self.logger.debug(f"=> {body}")
+        return body
@@ -1,54 +1,90 @@
-import yaml
 import csv
+from collections.abc import Iterator
+
+from src.cache import cached_by_file
+from src.yaml_utils import safe_load
+
+@cached_by_file('data_files')
+def _load_yaml_file(data_file):
+    """
+    Parses a YAML data file.
+    """
+    with open(data_file, 'rb') as f:
+        return safe_load(f)
+
+def _iter_csv_rows(data_file):
+    """
+    Yields the rows of a CSV file one at a time, as dicts keyed by the header.
+    """
+    with open(data_file, 'r', newline='') as f:
+        yield from csv.DictReader(f)
 
 def load_data(data_file):
     """
     Loads data from a YAML or CSV file.
+    CSV rows are streamed: an iterator is returned and the file is read as it is consumed.
     """
     if data_file.endswith('.yaml') or data_file.endswith('.yml'):
-        with open(data_file, 'r') as f:
-            return yaml.safe_load(f)
+        return _load_yaml_file(data_file)
     elif data_file.endswith('.csv'):
-        with open(data_file, 'r') as f:
-            return list(csv.DictReader(f))
+        return _iter_csv_rows(data_file)
     else:
         raise ValueError("Unsupported file type. Please use .yaml, .yml, or .csv")
 
-from src.notion_utils import find_database_by_title
+from src.notion_utils import find_database_by_title, run_concurrently
 
-def _find_page_by_property(notion_client, db_id, property_name, property_value, property_type):
+# Number of page writes queued before they are sent to Notion together.
+PAGE_WRITE_BATCH_SIZE = 50
+
+def _property_match_value(page, property_name):
     """
-    Finds a page in a database by a property's value.
-    Note: This is a simplified implementation. A robust solution would handle different property types.
+    Returns the value of a page's property as a string usable as a match key, or None.
+    The property is looked up by name, then by id (the title property always has id 'title').
     """
-    # Map common property names to their actual names in the database
-    property_name_mapping = {
-        'external_id': 'External ID',
-        'title': 'title'  # Keep as is for title properties
-    }
-    
-    # Use the mapped property name if it exists, otherwise use the original
-    actual_property_name = property_name_mapping.get(property_name, property_name)
-    
-    filter_conditions = {
-        "property": actual_property_name,
-        property_type: {
-            "equals": property_value
-        }
-    }
+    properties = page.get('properties', {})
+    prop = properties.get(property_name)
+    if prop is None:
+        prop = next((p for p in properties.values() if p.get('id') == property_name), None)
+    if prop is None:
+        return None
 
-    response = notion_client.databases.query(database_id=db_id, filter=filter_conditions)
-    return response.get('results')[0] if response.get('results') else None
+    prop_type = prop.get('type')
+    value = prop.get(prop_type)
+    if prop_type in ('title', 'rich_text'):
+        return ''.join(part.get('plain_text', '') for part in value or []) or None
+    if prop_type == 'select':
+        return value.get('name') if value else None
+    return str(value) if value is not None else None
 
-def _ensure_select_options(notion_client, db_id, prop_name, prop_definition, options_to_ensure, prop_type):
+def _index_pages_by_property(notion_client, db_id, property_name, property_id=None):
     """
-    Ensures that the given options exist for a select or multi-select property.
-    If not, it updates the database to add them.
+    Fetches every page of a database once and indexes them by the value of a property.
+    Returns a dict mapping the (string) property value to the page, reduced to its id.
+    If `property_id` is given, Notion is asked to return only that property of each page.
     """
-    existing_options = {opt['name'] for opt in prop_definition.get('options', [])}
-    new_options = [opt for opt in options_to_ensure if opt not in existing_options]
+    index = {}
+    query_kwargs = {'database_id': db_id, 'page_size': 100}
+    if property_id:
+        query_kwargs['filter_properties'] = [property_id]
+    while True:
+        response = notion_client.databases.query(**query_kwargs)
+        for page in response.get('results', []):
+            match_value = _property_match_value(page, property_name)
+            if match_value is not None:
+                # Only the id is needed to update the page; keeping just that lets the rest
+                # of the response be freed as soon as this batch of results is indexed
+                index.setdefault(match_value, {'id': page['id']})
+        if not response.get('has_more'):
+            return index
+        query_kwargs['start_cursor'] = response.get('next_cursor')
 
-    if new_options:
+def _add_select_options(notion_client, db_id, pending_options):
+    """
+    Adds the queued new options of select and multi-select properties to the database,
+    with one update per property, and empties the queue.
+    `pending_options` maps a property name to (prop_type, prop_definition, new_option_names).
+    """
+    for prop_name, (prop_type, prop_definition, new_options) in pending_options.items():
         print(f"Adding new options to '{prop_name}': {new_options}")
         updated_options = prop_definition.get('options', []) + [{'name': name} for name in new_options]
 
@@ -64,90 +100,157 @@ def _ensure_select_options(notion_client, db_id, prop_name, prop_definition, opt
         )
         # Update the local definition to avoid re-fetching
         prop_definition['options'] = updated_options
+    pending_options.clear()
 
-def _build_page_properties(record, db_id, db_properties, notion_client, create_missing_select_options):
+# Map common property names to their actual names in the database
+_PROPERTY_NAME_MAPPING = {
+    'external_id': 'External ID',
+    'title': 'title'  # Keep as is for title properties
+}
+
+# Property values are serialized right away and never modified, so the converters below
+# use tuples for JSON arrays (cheaper to build than lists) and skip redundant str() calls.
+
+def _text_run(value):
     """
-    Builds the page properties for the Notion API from a record.
+    Builds the single rich text run of a title or rich text value.
     """
-    page_properties = {}
-    
-    # Map common property names to their actual names in the database
-    property_name_mapping = {
-        'external_id': 'External ID',
-        'title': 'title'  # Keep as is for title properties
-    }
-    
-    for key, value in record.items():
+    return ({'text': {'content': value if type(value) is str else str(value)}},)
+
+def _title_value(value):
+    """
+    Builds a title property value.
+    """
+    return {'title': _text_run(value)}
+
+def _rich_text_value(value):
+    """
+    Builds a rich text property value.
+    """
+    return {'rich_text': _text_run(value)}
+
+def _date_value(value):
+    """
+    Builds a date property value from a start date string or a full date object.
+    """
+    if isinstance(value, str):
+        return {'date': {'start': value}}
+    elif isinstance(value, dict):
+        return {'date': value}
+    return None
+
+def _files_value(value):
+    """
+    Builds a files property value from a list of URLs or {'name', 'url'} dicts.
+    """
+    files_list = []
+    for item in value:
+        if isinstance(item, str):
+            files_list.append({'name': item.split('/')[-1], 'external': {'url': item}})
+        elif isinstance(item, dict) and 'url' in item:
+            files_list.append({'name': item.get('name', item['url'].split('/')[-1]), 'external': {'url': item['url']}})
+    return {'files': files_list}
+
+def _plain_value(prop_type):
+    """
+    Returns a converter for property types whose value is sent as is.
+    """
+    return lambda value: {prop_type: value}
+
+# Converters from a record value to a Notion property value, for the types that need no
+# database context. Returning None leaves the property out of the page.
+_VALUE_CONVERTERS = {
+    'title': _title_value,
+    'rich_text': _rich_text_value,
+    'number': _plain_value('number'),
+    'checkbox': _plain_value('checkbox'),
+    'url': _plain_value('url'),
+    'email': _plain_value('email'),
+    'phone_number': _plain_value('phone_number'),
+    'date': _date_value,
+    'files': _files_value,
+}
+
+def _compile_record_builder(db_properties, pending_options=None):
+    """
+    Specializes page property building for one database.
+    Returns a `build(record)` function producing the page properties for the Notion API.
+    The target property and converter of each record key are resolved only the first
+    time the key is seen, instead of being dispatched again for every record.
+    If `pending_options` is given, select and multi-select values missing from the
+    database are queued in it for `_add_select_options`.
+    """
+    def select_option_tracker(actual_key, prop_type, prop_definition):
+        # Option names are collected once per property; each value is then a set lookup
+        known_options = {opt['name'] for opt in prop_definition.get('options', [])}
+
+        def track(values):
+            for name in values:
+                if name not in known_options:
+                    known_options.add(name)
+                    pending_options.setdefault(actual_key, (prop_type, prop_definition, []))[2].append(name)
+        return track
+
+    def resolve(key):
         # Map the key to the actual property name in the database
-        actual_key = property_name_mapping.get(key, key)
+        actual_key = _PROPERTY_NAME_MAPPING.get(key, key)
         prop_info = db_properties.get(actual_key)
-        
+
         if not prop_info:
             if key != 'external_id':
                 print(f"Warning: Property '{actual_key}' not found in database schema. Skipping.")
-            continue
+            return None
 
         prop_type = prop_info['type']
 
         if actual_key == 'External ID':
-             page_properties[actual_key] = {'rich_text': [{'text': {'content': str(value)}}]}
-        elif prop_type == 'title':
-            page_properties[actual_key] = {'title': [{'text': {'content': str(value)}}]}
-        elif prop_type == 'rich_text':
-            page_properties[actual_key] = {'rich_text': [{'text': {'content': str(value)}}]}
-        elif prop_type == 'number':
-            page_properties[actual_key] = {'number': value}
-        elif prop_type == 'checkbox':
-            page_properties[actual_key] = {'checkbox': value}
-        elif prop_type == 'url':
-            page_properties[actual_key] = {'url': value}
-        elif prop_type == 'email':
-            page_properties[actual_key] = {'email': value}
-        elif prop_type == 'phone_number':
-            page_properties[actual_key] = {'phone_number': value}
-        elif prop_type == 'date':
-            if isinstance(value, str):
-                page_properties[actual_key] = {'date': {'start': value}}
-            elif isinstance(value, dict):
-                page_properties[actual_key] = {'date': value}
-        elif prop_type == 'files':
-            files_list = []
-            for item in value:
-                if isinstance(item, str):
-                    files_list.append({'name': item.split('/')[-1], 'external': {'url': item}})
-                elif isinstance(item, dict) and 'url' in item:
-                    files_list.append({'name': item.get('name', item['url'].split('/')[-1]), 'external': {'url': item['url']}})
-            page_properties[actual_key] = {'files': files_list}
+            return actual_key, _rich_text_value
+        elif prop_type in _VALUE_CONVERTERS:
+            return actual_key, _VALUE_CONVERTERS[prop_type]
         elif prop_type == 'select':
-            if create_missing_select_options:
-                _ensure_select_options(notion_client, db_id, actual_key, prop_info['select'], [value], prop_type)
-            page_properties[actual_key] = {'select': {'name': value}}
+            track = select_option_tracker(actual_key, prop_type, prop_info['select']) if pending_options is not None else None
+            def convert_select(value):
+                if track:
+                    track([value])
+                return {'select': {'name': value}}
+            return actual_key, convert_select
         elif prop_type == 'multi_select':
-            if create_missing_select_options:
-                _ensure_select_options(notion_client, db_id, actual_key, prop_info['multi_select'], value, prop_type)
-            page_properties[actual_key] = {'multi_select': [{'name': v} for v in value]}
+            track = select_option_tracker(actual_key, prop_type, prop_info['multi_select']) if pending_options is not None else None
+            def convert_multi_select(value):
+                if track:
+                    track(value)
+                return {'multi_select': [{'name': v} for v in value]}
+            return actual_key, convert_multi_select
         elif prop_type == 'relation':
-            related_pages_ids = []
-            values = value if isinstance(value, list) else [value]
-
-            for v in values:
-                # For now, we only support finding related page by title (string value)
-                if isinstance(v, str):
-                    # To find by title, we need to know the related database's title property name.
-                    # This requires an extra API call and makes things complex.
-                    # For this implementation, we assume a simple search can find it.
-                    # This is a simplification and may not be robust.
-                    related_db_id = prop_info['relation']['database_id']
+            def convert_relation(value):
+                values = value if isinstance(value, list) else [value]
+                for v in values:
+                    # Finding a related page by title would need the related database's
+                    # title property name, which takes an extra API call to retrieve.
+                    # This is not supported yet, so we just show a warning.
+                    if isinstance(v, str):
+                        print(f"Warning: Relation property '{actual_key}' is not fully supported yet. Skipping.")
+                return None
+            return actual_key, convert_relation
+        return None
 
-                    # This is a hack: we don't know the title property name of the other db.
-                    # We are assuming a simple query on the string value will work, which is not guaranteed.
-                    # A proper implementation would retrieve the related DB schema to find its title property.
+    resolved = {}
 
-                    # For now, this part is too complex to implement fully without more info.
-                    # We will just show a warning.
-                    print(f"Warning: Relation property '{actual_key}' is not fully supported yet. Skipping.")
+    def build(record):
+        page_properties = {}
+        for key, value in record.items():
+            if key not in resolved:
+                resolved[key] = resolve(key)
+            entry = resolved[key]
+            if entry is None:
+                continue
+            actual_key, convert = entry
+            prop_value = convert(value)
+            if prop_value is not None:
+                page_properties[actual_key] = prop_value
+        return page_properties
 
-    return page_properties
+    return build
 
 def _update_page(notion_client, page_id, properties):
     """
@@ -155,21 +258,52 @@ def _update_page(notion_client, page_id, properties):
     """
     notion_client.pages.update(page_id=page_id, properties=properties)
 
-def _transform_csv_row(row, map_config):
+def _write_page(notion_client, write):
+    """
+    Performs a single queued page write: (action, db_key, match_value, description, payload)
+    where action is 'create' or 'update'.
+    """
+    action, db_key, _, description, payload = write
+    if action == 'update':
+        print(f"Updating page in '{db_key}' ({description})...")
+        _update_page(notion_client, payload['page_id'], payload['properties'])
+        print(f"Successfully updated page.")
+    else:
+        print(f"Creating page in '{db_key}' ({description})...")
+        page = notion_client.pages.create(**payload)
+        print(f"Successfully created page.")
+        return page
+
+def _flush_page_writes(notion_client, db_id, writes, page_index, pending_options):
+    """
+    Sends the queued page writes to Notion concurrently and empties the queue.
+    The select options the writes rely on are added to the database first.
+    Created pages are added to `page_index` so later records can match them.
+    Returns the (write, exception) pairs of the writes that failed.
+    """
+    _add_select_options(notion_client, db_id, pending_options)
+    results, errors = run_concurrently(lambda write: _write_page(notion_client, write), writes)
+    for (action, _, match_value, _, _), page in results:
+        if action == 'create' and page:
+            page_index[str(match_value)] = {'id': page['id']}
+    for (action, db_key, _, description, _), error in errors:
+        print(f"Error: Failed to {action} page in '{db_key}' ({description}): {error}")
+    writes.clear()
+    return errors
+
+def _compile_csv_transform(map_config):
     """
-    Transforms a CSV row into a standard record format using a map config.
+    Builds a function transforming a CSV row into a standard record format using a map config.
+    The column mapping is read once here rather than for every row.
     """
-    record = {}
-    column_map = map_config.get('columns', {})
-    for csv_header, mapping in column_map.items():
-        if csv_header in row:
-            value = row[csv_header]
-            target_key = mapping.get('as', csv_header)
+    # (csv_header, target_key) pairs, in the order of the map file
+    mapping = [(csv_header, column.get('as', csv_header)) for csv_header, column in map_config.get('columns', {}).items()]
 
-            # Here we just copy the value. The property building logic will handle types.
-            record[target_key] = value
+    def transform(row):
+        # Here we just copy the value. The property building logic will handle types.
+        return {target_key: row[csv_header] for csv_header, target_key in mapping if csv_header in row}
 
-    return record
+    return transform
 
 def ingest_data_to_notion(data, notion_client, map_config=None, dry_run=False):
     """
@@ -192,7 +326,7 @@ def ingest_data_to_notion(data, notion_client, map_config=None, dry_run=False):
                 if 'match_on' in db_data:
                     defaults[f'{db_key}_match_on'] = db_data['match_on']
     # Handle CSV data
-    elif isinstance(data, list):
+    elif isinstance(data, (list, Iterator)):
         if not map_config:
             raise ValueError("A map file is required for CSV ingestion.")
         defaults = map_config.get('defaults', {})
@@ -200,7 +334,8 @@ def ingest_data_to_notion(data, notion_client, map_config=None, dry_run=False):
         if not target_db:
             raise ValueError("Map file must specify a `target_db`.")
 
-        transformed_records = [_transform_csv_row(row, map_config) for row in data]
+        # Rows are transformed lazily so a streamed CSV is never held in memory at once
+        transformed_records = map(_compile_csv_transform(map_config), data)
         data_items = {target_db: transformed_records}
     else:
         raise ValueError("Unsupported data format.")
@@ -210,6 +345,7 @@ def ingest_data_to_notion(data, notion_client, map_config=None, dry_run=False):
     # Map common property names to their actual names in the database
     property_name_mapping = {'external_id': 'External ID', 'title': 'title', 'Brand': 'Brand'}
 
+    errors = []
     for db_key, records in data_items.items():
         if dry_run:
             plan.append(f"[DRY RUN] Plan to find database with title: '{db_key}'")
@@ -229,58 +365,84 @@ def ingest_data_to_notion(data, notion_client, map_config=None, dry_run=False):
         db_id = db['id']
         db_properties = db.get('properties', {})
         
+        # Get the match_on key for this specific database
+        db_match_on = defaults.get(f'{db_key}_match_on', 'external_id')
+
         # Debug: Print available properties
         print(f"Available properties in database '{db_key}': {list(db_properties.keys())}")
-        if 'external_id' in [record.get('external_id') for record in records]:
+        if db_match_on == 'external_id':
             print(f"Looking for 'external_id' property, mapped to: {property_name_mapping.get('external_id', 'external_id')}")
             if 'External ID' in db_properties:
                 print(f"'External ID' property found with type: {db_properties['External ID']['type']}")
             else:
                 print("'External ID' property NOT found in database")
 
+        # Map the match_on property name to the actual property name in the database
+        actual_match_property = property_name_mapping.get(db_match_on, db_match_on)
+
+        # Existing pages are fetched once and matched in memory instead of querying per record
+        if dry_run:
+            page_index = {}
+        else:
+            match_property_id = db_properties.get(actual_match_property, {}).get('id')
+            page_index = _index_pages_by_property(notion_client, db_id, actual_match_property, match_property_id)
+
+        # Page writes are queued and sent in concurrent batches. The match values of the
+        # queued writes are tracked so that a record repeating one of them is only looked
+        # up once the earlier write has landed.
+        pending_writes = []
+        pending_match_values = set()
+        # New select options are queued too and added in one update per property per batch
+        pending_options = {}
+
+        if not dry_run:
+            build_page_properties = _compile_record_builder(
+                db_properties, pending_options if create_missing_select_options else None
+            )
+
         for record in records:
-            # Get the match_on key for this specific database
-            db_match_on = defaults.get(f'{db_key}_match_on', 'external_id')
             match_value = record.get(db_match_on)
             if not match_value:
                 print(f"Warning: Record is missing match key '{db_match_on}'. Skipping.")
                 continue
 
-            existing_page = None
-            if not dry_run:
-                # Map the match_on property name to the actual property name in the database
-                actual_match_property = property_name_mapping.get(db_match_on, db_match_on)
-                
-                # Get the property info from the database to determine the correct type
-                match_prop_info = db_properties.get(actual_match_property)
-                if match_prop_info:
-                    prop_type = match_prop_info['type']
-                else:
-                    # Fallback to default types
-                    prop_type = 'title' if db_match_on == 'title' else 'rich_text'
-                
-                existing_page = _find_page_by_property(notion_client, db_id, db_match_on, match_value, prop_type)
+            if match_value in pending_match_values:
+                errors.extend(_flush_page_writes(notion_client, db_id, pending_writes, page_index, pending_options))
+                pending_match_values.clear()
+
+            existing_page = page_index.get(str(match_value))
 
             if dry_run:
                 # In dry-run, we don't build properties as it might try to update a schema
                 page_properties = {}
             else:
-                page_properties = _build_page_properties(record, db_id, db_properties, notion_client, create_missing_select_options)
+                page_properties = build_page_properties(record)
 
             if existing_page:
                 if dry_run:
                     plan.append(f"  - Plan to UPDATE page in '{db_key}' (matched on {db_match_on}: {match_value})")
                 else:
-                    print(f"Updating page in '{db_key}' (matched on {db_match_on}: {match_value})...")
-                    _update_page(notion_client, existing_page['id'], page_properties)
-                    print(f"Successfully updated page.")
+                    pending_writes.append(('update', db_key, match_value, f"matched on {db_match_on}: {match_value}",
+                                           {'page_id': existing_page['id'], 'properties': page_properties}))
             else:
                 if dry_run:
                     plan.append(f"  - Plan to CREATE page in '{db_key}' ({db_match_on}: {match_value})")
                 else:
-                    print(f"Creating page in '{db_key}' ({db_match_on}: {match_value})...")
-                    notion_client.pages.create(parent={"database_id": db_id}, properties=page_properties)
-                    print(f"Successfully created page.")
+                    pending_writes.append(('create', db_key, match_value, f"{db_match_on}: {match_value}",
+                                           {'parent': {"database_id": db_id}, 'properties': page_properties}))
+
+            if not dry_run:
+                pending_match_values.add(match_value)
+                if len(pending_writes) >= PAGE_WRITE_BATCH_SIZE:
+                    errors.extend(_flush_page_writes(notion_client, db_id, pending_writes, page_index, pending_options))
+                    pending_match_values.clear()
+
+        errors.extend(_flush_page_writes(notion_client, db_id, pending_writes, page_index, pending_options))
+
+    if errors:
+        # Every batch has been attempted; the failures still fail the ingestion as a whole
+        print(f"Error: {len(errors)} page write(s) failed.")
+        raise errors[0][1]
 
     if dry_run:
         return plan
@@ -1,25 +1,157 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from notion_client import APIResponseError
+
+from src.cache import cache_delete, cache_get, cache_set
+
+# Upper bound on the number of Notion API requests kept in flight at once.
+MAX_CONCURRENT_REQUESTS = 8
+
+def run_concurrently(func, items, max_workers=MAX_CONCURRENT_REQUESTS):
+    """
+    Calls `func` on every item using a pool of threads.
+    A failing call does not stop the others. Returns a `(results, errors)` tuple holding
+    `(item, return_value)` and `(item, exception)` pairs, in the order of `items`.
+    """
+    results, errors = [], []
+    if not items:
+        return results, errors
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        futures = [(item, executor.submit(func, item)) for item in items]
+        for item, future in futures:
+            try:
+                results.append((item, future.result()))
+            except Exception as e:
+                errors.append((item, e))
+    return results, errors
+
+# How long (in seconds) a database found by title is reused before searching again.
+DATABASE_CACHE_TTL = 300
+
+# How many databases are kept in memory; the least recently used ones are dropped first.
+DATABASE_CACHE_SIZE = 256
+
+# Databases already found, keyed by (auth token, casefolded title), as (expires_at, database).
+# Keying on the token rather than the client keeps no client alive, and clients sharing
+# a token see the same workspace. Misses are not cached so that a database created later
+# in the run can still be found.
+_database_cache = OrderedDict()
+_database_cache_lock = threading.Lock()
+
+def _client_auth(notion_client):
+    """
+    Returns the auth token of a client, or None when it has none to key the cache on.
+    """
+    auth = getattr(getattr(notion_client, 'options', None), 'auth', None)
+    return auth if isinstance(auth, str) else None
+
+def _get_cached_database(cache_key):
+    """
+    Returns a database from the in-memory cache, dropping it if it has expired.
+    """
+    with _database_cache_lock:
+        entry = _database_cache.get(cache_key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del _database_cache[cache_key]
+            return None
+        _database_cache.move_to_end(cache_key)
+        return entry[1]
+
+def _cache_database(cache_key, db):
+    """
+    Stores a database in the in-memory cache, evicting the least recently used when full.
+    """
+    with _database_cache_lock:
+        _database_cache[cache_key] = (time.monotonic() + DATABASE_CACHE_TTL, db)
+        _database_cache.move_to_end(cache_key)
+        while len(_database_cache) > DATABASE_CACHE_SIZE:
+            _database_cache.popitem(last=False)
+
+def _database_title(db):
+    """
+    Returns the plain text title of a database object.
+    """
+    return ''.join(part.get('plain_text', '') for part in db.get('title', []))
+
+def _search_database_by_title(notion_client, title):
+    """
+    Searches for a database whose title matches exactly (ignoring case), following pagination.
+    """
+    title_key = title.casefold()
+    search_kwargs = {'query': title, 'filter': {"property": "object", "value": "database"}}
+    while True:
+        response = notion_client.search(**search_kwargs)
+        for db in response.get('results', []):
+            # The search can be broad, so we need to find an exact match for the title
+            if _database_title(db).casefold() == title_key:
+                return db
+        if not response.get('has_more'):
+            return None
+        search_kwargs['start_cursor'] = response.get('next_cursor')
+
+def _retrieve_known_database(notion_client, db_id, title):
+    """
+    Retrieves a database by an id remembered from a previous run.
+    Returns None if it no longer exists or has been renamed.
+    """
+    try:
+        db = notion_client.databases.retrieve(database_id=db_id)
+    except APIResponseError:
+        return None
+    if db.get('archived') or db.get('in_trash') or _database_title(db).casefold() != title.casefold():
+        return None
+    return db
+
 def find_database_by_title(notion_client, title):
     """
     Finds a database by its title.
     Returns the database object if found, otherwise None.
+    Found databases are cached in memory for DATABASE_CACHE_TTL seconds, for clients
+    authenticated with a token. When the persistent
+    cache is enabled, their ids are also remembered across runs, so that a later run can
+    retrieve the database directly instead of searching for it.
+    """
+    title_key = title.casefold()
+    auth = _client_auth(notion_client)
+    cache_key = (auth, title_key)
+    if auth is not None:
+        cached = _get_cached_database(cache_key)
+        if cached is not None:
+            return cached
+
+    db = None
+    known_id = cache_get('database_ids', title_key)
+    if known_id:
+        db = _retrieve_known_database(notion_client, known_id, title)
+    if db is None:
+        db = _search_database_by_title(notion_client, title)
+
+    if db is None:
+        cache_delete('database_ids', title_key)
+        return None
+
+    cache_set('database_ids', title_key, db['id'])
+    if auth is not None:
+        _cache_database(cache_key, db)
+    return db
+
+def index_databases_by_title(notion_client):
+    """
+    Lists every database the integration can access, following pagination.
+    Returns a dict mapping each casefolded title to its database object.
     """
-    response = notion_client.search(query=title, filter={"property": "object", "value": "database"})
-    for db in response.get('results', []):
-        # The search can be broad, so we need to find an exact match for the title
-        if db.get('title', [{}])[0].get('plain_text').lower() == title.lower():
-            return db
-    return None
-
-def find_page_by_title_and_parent(notion_client, title, parent_id):
-    """
-    Finds a page by its title within a specific parent page.
-    This is tricky because search doesn't directly support parent filtering this way.
-    We have to search for the title and then filter the results by parent.
-    """
-    response = notion_client.search(query=title, filter={"property": "object", "value": "page"})
-    for page in response.get('results', []):
-        page_title = page.get('properties', {}).get('title', {}).get('title', [{}])[0].get('plain_text')
-        page_parent_id = page.get('parent', {}).get('page_id')
-        if page_title.lower() == title.lower() and page_parent_id == parent_id:
-            return page
-    return None
+    index = {}
+    search_kwargs = {'filter': {"property": "object", "value": "database"}, 'page_size': 100}
+    while True:
+        response = notion_client.search(**search_kwargs)
+        for db in response.get('results', []):
+            index.setdefault(_database_title(db).casefold(), db)
+        if not response.get('has_more'):
+            return index
+        search_kwargs['start_cursor'] = response.get('next_cursor')
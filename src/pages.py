@@ -1,118 +1,275 @@
 import os
-import yaml
+import re
 from pathlib import Path
 from markdown_it import MarkdownIt
+from markdown_it.tree import SyntaxTreeNode
 
-from src.notion_utils import find_page_by_title_and_parent
+from src.notion_utils import run_concurrently
+from src.yaml_utils import safe_load
+
+# YAML front matter: a block fenced by '---' lines at the very start of the file,
+# after the UTF-8 byte order mark some editors write
+_FRONT_MATTER_RE = re.compile(rb'\A(?:\xef\xbb\xbf)?---[ \t]*\r?\n(.*?)^---[ \t]*(?:\r?\n|\Z)', re.DOTALL | re.MULTILINE)
+
+# The API accepts at most this many children per create or append request.
+MAX_BLOCKS_PER_REQUEST = 100
+
+# Shared parser: building the rule chains is costly, while parse() keeps all of its
+# state per call, so one instance can serve every page and thread.
+_MD = MarkdownIt()
+
+def _iter_markdown_files(directory):
+    """
+    Yields the paths of the markdown files under a directory, recursively.
+    scandir reports each entry's type along with its name, so unlike Path.rglob this
+    needs no stat call per entry. Symlinked directories are not followed, as with rglob.
+    """
+    subdirectories = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.name.endswith('.md') and entry.is_file():
+                yield Path(entry.path)
+    for subdirectory in subdirectories:
+        yield from _iter_markdown_files(subdirectory)
 
 def _parse_markdown_file(file_path):
     """
     Parses a markdown file, separating YAML front matter from the content.
     """
-    with open(file_path, 'r') as f:
+    with open(file_path, 'rb') as f:
         content = f.read()
 
-    parts = content.split('---', 2)
-    if len(parts) < 3:
-        return {}, content # No front matter
+    match = _FRONT_MATTER_RE.match(content)
+    if not match:
+        return {}, content.decode('utf-8-sig') # No front matter
 
-    front_matter = yaml.safe_load(parts[1])
-    body = parts[2].lstrip()
+    front_matter = safe_load(match.group(1)) or {}
+    body = content[match.end():].lstrip().decode('utf-8')
     return front_matter, body
 
+def _text_block(block_type, content):
+    """
+    Builds a Notion block of the given type holding a single run of plain text.
+    """
+    return {
+        "object": "block",
+        "type": block_type,
+        block_type: {"rich_text": [{"type": "text", "text": {"content": content}}]}
+    }
+
+def _inline_content(node):
+    """
+    Returns the raw inline text of a heading or paragraph node.
+    """
+    return node.children[0].content if node.children else ''
+
+# Notion block type for each markdown heading tag. Notion only has three heading levels.
+_HEADING_BLOCK_TYPES = {'h1': 'heading_1', 'h2': 'heading_2', 'h3': 'heading_3'}
+
+def _heading_blocks(node):
+    """
+    Converts a heading node into a Notion heading block.
+    """
+    block_type = _HEADING_BLOCK_TYPES.get(node.tag)
+    if not block_type:
+        return []
+    return [_text_block(block_type, _inline_content(node))]
+
+def _paragraph_blocks(node):
+    """
+    Converts a paragraph node into a Notion paragraph block.
+    """
+    return [_text_block("paragraph", _inline_content(node))]
+
+# Handlers turning a syntax tree node (and its subtree) into Notion blocks
+_BLOCK_HANDLERS = {
+    'heading': _heading_blocks,
+    'paragraph': _paragraph_blocks,
+}
+
+# Nodes without a handler that cannot contain headings or paragraphs, so are not walked into
+_LEAF_NODE_TYPES = frozenset({'inline', 'fence', 'code_block', 'hr', 'html_block'})
+
+def _collect_blocks(node, blocks):
+    """
+    Walks the children of a syntax tree node, appending the Notion blocks they produce.
+    Containers without a handler (lists, blockquotes...) are walked into.
+    """
+    for child in node.children:
+        handler = _BLOCK_HANDLERS.get(child.type)
+        if handler:
+            blocks.extend(handler(child))
+        elif child.type not in _LEAF_NODE_TYPES:
+            _collect_blocks(child, blocks)
+
 def _markdown_to_notion_blocks(md_body):
     """
     Converts a markdown string into a list of Notion block objects.
     """
-    md = MarkdownIt()
-    tokens = md.parse(md_body)
+    # SyntaxTreeNode pairs every *_open token with its *_close in a single stack-based pass,
+    # so containers (lists, blockquotes) never need a lookahead scan for their end
+    tree = SyntaxTreeNode(_MD.parse(md_body))
 
     blocks = []
-    for token in tokens:
-        if token.type == 'heading_open':
-            heading_level = int(token.tag[1])
-            if heading_level <= 3:
-                blocks.append({
-                    "object": "block",
-                    "type": f"heading_{heading_level}",
-                    f"heading_{heading_level}": {"rich_text": [{"type": "text", "text": {"content": ""}}]}
-                })
-        elif token.type == 'inline' and blocks:
-            # Add content to the last created block
-            last_block = blocks[-1]
-            block_type = last_block['type']
-            last_block[block_type]['rich_text'][0]['text']['content'] = token.content
-        elif token.type == 'paragraph_open':
-             blocks.append({
-                "object": "block",
-                "type": "paragraph",
-                "paragraph": {"rich_text": [{"type": "text", "text": {"content": ""}}]}
-            })
+    _collect_blocks(tree, blocks)
 
     # Filter out empty blocks
     return [b for b in blocks if b[b['type']]['rich_text'][0]['text']['content']]
 
 
+def _load_page(file_path):
+    """
+    Parses a markdown file to publish.
+    Returns (front_matter, body), or None if the page is missing required front matter.
+    """
+    print(f"Processing page: {file_path}")
+    front_matter, body = _parse_markdown_file(file_path)
+
+    title = front_matter.get('title')
+    if not title:
+        print(f"Warning: Page '{file_path}' is missing a title. Skipping.")
+        return None
+
+    parent_page_id = front_matter.get('parent_page_id')
+    if not parent_page_id:
+        # In a real tool, this might come from a global config
+        print(f"Warning: Page '{title}' is missing a parent_page_id. Skipping.")
+        return None
+
+    return front_matter, body
+
+def _index_child_pages(notion_client, parent_id):
+    """
+    Lists the child pages of a page once and indexes them by lowercased title.
+    """
+    index = {}
+    for block in _list_child_blocks(notion_client, parent_id):
+        if block.get('type') == 'child_page':
+            index.setdefault(block['child_page']['title'].lower(), block)
+    return index
+
+def _publish_page(notion_client, front_matter, body, existing_page):
+    """
+    Publishes a parsed markdown page to Notion, updating `existing_page` if given
+    or creating a new page otherwise.
+    """
+    title = front_matter['title']
+    parent_page_id = front_matter['parent_page_id']
+
+    blocks = _markdown_to_notion_blocks(body)
+
+    page_payload = {
+        "properties": {"title": [{"type": "text", "text": {"content": title}}]},
+    }
+
+    if 'icon' in front_matter:
+        page_payload['icon'] = {'type': 'emoji', 'emoji': front_matter['icon']}
+    if 'cover_url' in front_matter:
+        page_payload['cover'] = {'type': 'external', 'external': {'url': front_matter['cover_url']}}
+
+    if existing_page:
+        page_id = existing_page['id']
+        print(f"Updating page: '{title}' (ID: {page_id})")
+        notion_client.pages.update(page_id=page_id, **page_payload)
+        _update_page_blocks(notion_client, page_id, blocks)
+        print(f"Successfully updated page: '{title}'.")
+    else:
+        print(f"Creating page: '{title}'")
+        page_payload['parent'] = {"page_id": parent_page_id}
+        page_payload['children'] = blocks[:MAX_BLOCKS_PER_REQUEST]
+        created_page = notion_client.pages.create(**page_payload)
+        _append_blocks(notion_client, created_page['id'], blocks[MAX_BLOCKS_PER_REQUEST:])
+        print(f"Successfully created page: '{title}'")
+
 def publish_pages_to_notion(directory, notion_client):
     """
     Publishes markdown pages from a directory to Notion.
+    Pages are independent of each other, so they are published concurrently.
     """
     print(f"Publishing pages from directory: {directory}")
-    for file_path in Path(directory).rglob('*.md'):
-        print(f"Processing page: {file_path}")
-        front_matter, body = _parse_markdown_file(file_path)
-
-        title = front_matter.get('title')
-        if not title:
-            print(f"Warning: Page '{file_path}' is missing a title. Skipping.")
-            continue
-
-        parent_page_id = front_matter.get('parent_page_id')
-        if not parent_page_id:
-            # In a real tool, this might come from a global config
-            print(f"Warning: Page '{title}' is missing a parent_page_id. Skipping.")
-            continue
-
-        existing_page = find_page_by_title_and_parent(notion_client, title, parent_page_id)
-
-        blocks = _markdown_to_notion_blocks(body)
-
-        page_payload = {
-            "properties": {"title": [{"type": "text", "text": {"content": title}}]},
-        }
-
-        if 'icon' in front_matter:
-            page_payload['icon'] = {'type': 'emoji', 'emoji': front_matter['icon']}
-        if 'cover_url' in front_matter:
-            page_payload['cover'] = {'type': 'external', 'external': {'url': front_matter['cover_url']}}
-
-        if existing_page:
-            page_id = existing_page['id']
-            print(f"Updating page: '{title}' (ID: {page_id})")
-            notion_client.pages.update(page_id=page_id, **page_payload)
-            _update_page_blocks(notion_client, page_id, blocks)
-            print(f"Successfully updated page: '{title}'.")
-        else:
-            print(f"Creating page: '{title}'")
-            page_payload['parent'] = {"page_id": parent_page_id}
-            page_payload['children'] = blocks
-            notion_client.pages.create(**page_payload)
-            print(f"Successfully created page: '{title}'")
+    file_paths = list(_iter_markdown_files(directory))
+
+    loaded, errors = run_concurrently(_load_page, file_paths)
+    for file_path, error in errors:
+        print(f"Error: Failed to read page '{file_path}': {error}")
+    failures = [error for _, error in errors]
+    pages = [(file_path, *page) for file_path, page in loaded if page]
+
+    # Existing pages are found by listing each parent's children once,
+    # rather than running a search for every page being published
+    parent_ids = list(dict.fromkeys(front_matter['parent_page_id'] for _, front_matter, _ in pages))
+    indexed, errors = run_concurrently(lambda parent_id: _index_child_pages(notion_client, parent_id), parent_ids)
+    for parent_id, error in errors:
+        print(f"Error: Failed to list the pages under '{parent_id}': {error}")
+    failures.extend(error for _, error in errors)
+    child_pages = dict(indexed)
+
+    def publish(page):
+        _, front_matter, body = page
+        existing_page = child_pages[front_matter['parent_page_id']].get(front_matter['title'].lower())
+        _publish_page(notion_client, front_matter, body, existing_page)
+
+    pages = [page for page in pages if page[1]['parent_page_id'] in child_pages]
+    _, errors = run_concurrently(publish, pages)
+    for (file_path, _, _), error in errors:
+        print(f"Error: Failed to publish page '{file_path}': {error}")
+    failures.extend(error for _, error in errors)
+
+    if failures:
+        # Every page has been attempted; the failures still fail the publish as a whole
+        print(f"Error: {len(failures)} page(s) could not be published.")
+        raise failures[0]
+
+def _list_child_blocks(notion_client, block_id):
+    """
+    Returns all the child blocks of a block, following pagination.
+    """
+    blocks = []
+    list_kwargs = {'block_id': block_id, 'page_size': 100}
+    while True:
+        response = notion_client.blocks.children.list(**list_kwargs)
+        blocks.extend(response.get('results', []))
+        if not response.get('has_more'):
+            return blocks
+        list_kwargs['start_cursor'] = response.get('next_cursor')
+
+def _append_blocks(notion_client, block_id, blocks):
+    """
+    Appends blocks to a block or page, in chunks within the per-request limit.
+    Chunks are sent one after the other, since each one is added after the previous.
+    """
+    for start in range(0, len(blocks), MAX_BLOCKS_PER_REQUEST):
+        notion_client.blocks.children.append(block_id=block_id, children=blocks[start:start + MAX_BLOCKS_PER_REQUEST])
+
+def _block_signature(block):
+    """
+    Returns what identifies the content of a block: its type, whether it has children,
+    and its plain text. Works for blocks read from the API and blocks built locally.
+    """
+    block_type = block.get('type')
+    rich_text = block.get(block_type, {}).get('rich_text', []) if block_type else []
+    text = ''.join(part.get('plain_text', part.get('text', {}).get('content', '')) for part in rich_text)
+    return block_type, block.get('has_children', False), text
 
 def _update_page_blocks(notion_client, page_id, new_blocks):
     """
     Updates the content of a page by replacing all its blocks.
+    Nothing is rewritten when the page already holds the same content.
     """
     # First, get all existing blocks
-    existing_blocks = notion_client.blocks.children.list(block_id=page_id)['results']
+    existing_blocks = _list_child_blocks(notion_client, page_id)
+
+    if [_block_signature(b) for b in existing_blocks] == [_block_signature(b) for b in new_blocks]:
+        print(f"Content of page '{page_id}' is unchanged. Skipping block update.")
+        return
 
-    # Delete all existing blocks
-    # Note: The API has a limit of 100 blocks per request for both list and delete.
-    # A more robust implementation would handle pagination.
+    # Delete all existing blocks. They are deleted one by one: pages are already published
+    # concurrently, and a pool per page would multiply the requests in flight.
+    # A failure stops here, as appending would leave the old content mixed with the new one.
     for block in existing_blocks:
         notion_client.blocks.delete(block_id=block['id'])
 
     # Add the new blocks
-    # Note: The API has a limit of 100 blocks per request for append.
-    if new_blocks:
-        notion_client.blocks.children.append(block_id=page_id, children=new_blocks)
+    _append_blocks(notion_client, page_id, new_blocks)
@@ -1,81 +1,185 @@
+import copy
+import logging
+import os
+from collections import defaultdict
+from collections.abc import Hashable
+from functools import lru_cache
+
 import yaml
 
+from src.yaml_utils import safe_load
+
+log = logging.getLogger(__name__)
+
+@lru_cache(maxsize=32)
+def _load_schema_cached(schema_path, mtime_ns, size):
+    """
+    Parses a schema file. The modification time and size only take part in the cache key,
+    so that an edited file is parsed again.
+    """
+    with open(schema_path, 'rb') as f:
+        return safe_load(f)
+
 def load_schema(schema_file):
     """
     Loads a schema from a YAML file.
+    Parsed schemas are cached in memory while the file is unchanged; each call returns
+    its own copy, so callers are free to modify it.
     """
-    with open(schema_file, 'r') as f:
-        return yaml.safe_load(f)
+    schema_path = os.path.abspath(schema_file)
+    stat = os.stat(schema_path)
+    return copy.deepcopy(_load_schema_cached(schema_path, stat.st_mtime_ns, stat.st_size))
 
-from src.notion_utils import find_database_by_title
-
-def _create_database(notion_client, parent_page_id, db_config):
+def peek_schema_header(schema_file, keys=('version', 'workspace')):
     """
-    Creates a new database in Notion.
+    Reads only the given top-level keys of a schema file, e.g. for cheap prechecks.
+    The header keys come first in a schema, so parsing stops at the first other top-level
+    key. When that happens before every key was found, or the header cannot be read this
+    way (e.g. it uses aliases), the whole file is loaded with load_schema instead.
     """
-    title = db_config.get('title')
-    properties = _build_properties(db_config.get('properties', {}))
+    wanted = set(keys)
+    header = {}
+    with open(schema_file, 'rb') as f:
+        # The pure-Python loader is used for its per-node composer API, which the
+        # libyaml bindings do not expose; it reads the file incrementally. It is much
+        # slower than the libyaml loader, so it is never used past the header.
+        loader = yaml.SafeLoader(f)
+        try:
+            loader.get_event()  # Stream start
+            if loader.check_event(yaml.DocumentStartEvent):
+                loader.get_event()
+                if loader.check_event(yaml.MappingStartEvent):
+                    loader.get_event()
+                    while wanted and not loader.check_event(yaml.MappingEndEvent):
+                        key = loader.construct_object(loader.compose_node(None, None))
+                        if not isinstance(key, Hashable) or key not in wanted:
+                            break
+                        wanted.discard(key)
+                        header[key] = loader.construct_object(loader.compose_node(None, None), deep=True)
+                    else:
+                        return header
+        except yaml.YAMLError:
+            pass
+        finally:
+            loader.dispose()
+
+    schema = load_schema(schema_file)
+    if not isinstance(schema, dict):
+        return {}
+    return {key: schema[key] for key in keys if key in schema}
 
+from src.notion_utils import index_databases_by_title, run_concurrently
+
+# Number formats accepted by the Notion API
+_VALID_NUMBER_FORMATS = frozenset((
+    'number', 'number_with_commas', 'percent', 'dollar', 'australian_dollar',
+    'canadian_dollar', 'singapore_dollar', 'euro', 'pound', 'yen', 'ruble',
+    'rupee', 'won', 'yuan', 'real', 'lira', 'rupiah', 'franc', 'hong_kong_dollar',
+    'new_zealand_dollar', 'krona', 'norwegian_krone', 'mexican_peso', 'rand',
+    'new_taiwan_dollar', 'danish_krone', 'zloty', 'baht', 'forint', 'koruna',
+    'shekel', 'chilean_peso', 'philippine_peso', 'dirham', 'colombian_peso',
+    'riyal', 'ringgit', 'leu', 'argentine_peso', 'uruguayan_peso', 'peruvian_sol'
+))
+
+def _create_database(notion_client, parent_page_id, title, properties):
+    """
+    Creates a new database in Notion with already built properties.
+    """
     return notion_client.databases.create(
         parent={"page_id": parent_page_id},
         title=[{"type": "text", "text": {"content": title}}],
         properties=properties,
     )
 
+def _build_number(name, prop):
+    """
+    Builds a number property, validating its format.
+    """
+    format_value = prop.get('format', 'number')
+    # Validate number format values for Notion API
+    if format_value not in _VALID_NUMBER_FORMATS:
+        raise ValueError(f"Invalid number format '{format_value}' for property '{name}'. Valid formats are: {', '.join(sorted(_VALID_NUMBER_FORMATS))}")
+    return {"number": {"format": format_value}}
+
+def _empty_config(prop_type):
+    """
+    Returns a builder for property types that take no configuration.
+    """
+    # Every property of the type shares this one dict, which must therefore never be mutated
+    config = {prop_type: {}}
+    return lambda name, prop: config
+
+def _options_config(prop_type):
+    """
+    Returns a builder for property types configured with a list of options.
+    """
+    return lambda name, prop: {prop_type: {"options": prop.get('options', [])}}
+
+# Builders of the Notion API property object for each schema property type
+_PROP_BUILDERS = {
+    'title': _empty_config('title'),
+    'rich_text': _empty_config('rich_text'),
+    'number': _build_number,
+    'select': _options_config('select'),
+    'multi_select': _options_config('multi_select'),
+    'date': _empty_config('date'),
+    'files': _empty_config('files'),
+    'url': _empty_config('url'),
+    'email': _empty_config('email'),
+    'phone_number': _empty_config('phone_number'),
+    'checkbox': _empty_config('checkbox'),
+}
+
+def _property_builder(name, prop):
+    """
+    Returns the builder for a schema property, raising a ValueError for an unsupported type.
+    """
+    builder = _PROP_BUILDERS.get(prop.get('type'))
+    if builder is None:
+        raise ValueError(f"Unsupported type '{prop.get('type')}' for property '{name}'. Supported types are: {', '.join(_PROP_BUILDERS)}")
+    return builder
+
 def _build_properties(schema_properties):
     """
     Builds the properties object for the Notion API from the schema.
+    Raises a ValueError for a property of an unsupported type.
+    """
+    return {name: _property_builder(name, prop)(name, prop) for name, prop in schema_properties.items()}
+
+def _config_matches(wanted, actual):
+    """
+    Checks whether a schema property config is already satisfied by the existing one.
+    The existing side may carry extra server-generated fields (ids, option colors, ...).
+    """
+    if isinstance(wanted, dict):
+        return isinstance(actual, dict) and all(
+            key in actual and _config_matches(value, actual[key]) for key, value in wanted.items()
+        )
+    if isinstance(wanted, list):
+        return (
+            isinstance(actual, list) and len(wanted) == len(actual)
+            and all(_config_matches(w, a) for w, a in zip(wanted, actual))
+        )
+    return wanted == actual
+
+def _changed_properties(schema_properties, existing_properties):
     """
-    notion_properties = {}
+    Returns the schema properties that are missing from, or differ in, the existing database.
+    """
+    changed = {}
     for name, prop in schema_properties.items():
-        prop_type = prop.get('type')
-        if prop_type not in notion_properties:
-            notion_properties[name] = {}
-
-        if prop_type == 'title':
-            notion_properties[name] = {"title": {}}
-        elif prop_type == 'rich_text':
-            notion_properties[name] = {"rich_text": {}}
-        elif prop_type == 'number':
-            format_value = prop.get('format', 'number')
-            # Validate number format values for Notion API
-            valid_formats = [
-                'number', 'number_with_commas', 'percent', 'dollar', 'australian_dollar',
-                'canadian_dollar', 'singapore_dollar', 'euro', 'pound', 'yen', 'ruble',
-                'rupee', 'won', 'yuan', 'real', 'lira', 'rupiah', 'franc', 'hong_kong_dollar',
-                'new_zealand_dollar', 'krona', 'norwegian_krone', 'mexican_peso', 'rand',
-                'new_taiwan_dollar', 'danish_krone', 'zloty', 'baht', 'forint', 'koruna',
-                'shekel', 'chilean_peso', 'philippine_peso', 'dirham', 'colombian_peso',
-                'riyal', 'ringgit', 'leu', 'argentine_peso', 'uruguayan_peso', 'peruvian_sol'
-            ]
-            if format_value not in valid_formats:
-                raise ValueError(f"Invalid number format '{format_value}' for property '{name}'. Valid formats are: {', '.join(valid_formats)}")
-            notion_properties[name] = {"number": {"format": format_value}}
-        elif prop_type == 'select':
-            notion_properties[name] = {"select": {"options": prop.get('options', [])}}
-        elif prop_type == 'multi_select':
-            notion_properties[name] = {"multi_select": {"options": prop.get('options', [])}}
-        elif prop_type == 'date':
-            notion_properties[name] = {"date": {}}
-        elif prop_type == 'files':
-            notion_properties[name] = {"files": {}}
-        elif prop_type == 'url':
-            notion_properties[name] = {"url": {}}
-        elif prop_type == 'email':
-            notion_properties[name] = {"email": {}}
-        elif prop_type == 'phone_number':
-            notion_properties[name] = {"phone_number": {}}
-        elif prop_type == 'checkbox':
-            notion_properties[name] = {"checkbox": {}}
-
-    return notion_properties
-
-def _update_database(notion_client, existing_db, db_config, update_mode):
-    """
-    Updates an existing database in Notion.
+        existing = existing_properties.get(name)
+        # Existing properties look like {'id': ..., 'name': ..., 'type': t, t: {...}};
+        # only the type-keyed config is comparable with the schema's {t: {...}}
+        if existing is None or not _config_matches(prop, {existing.get('type'): existing.get(existing.get('type'))}):
+            changed[name] = prop
+    return changed
+
+def _update_database(notion_client, existing_db, title, schema_properties, update_mode):
+    """
+    Updates an existing database in Notion with already built properties.
     """
     db_id = existing_db['id']
-    schema_properties = _build_properties(db_config.get('properties', {}))
 
     if update_mode == 'replace':
         # Replace mode: All existing properties are removed and replaced with the schema properties
@@ -86,17 +190,55 @@ def _update_database(notion_client, existing_db, db_config, update_mode):
 
     elif update_mode == 'merge':
         # Merge mode: Add new properties and update existing ones.
-        existing_properties = existing_db.get('properties', {})
-        properties_to_update = existing_properties.copy()
-        properties_to_update.update(schema_properties)
+        # Notion keeps the properties left out of an update, so only the ones that differ
+        # need to be sent, and a re-run with nothing to change makes no API call.
+        properties_to_update = _changed_properties(schema_properties, existing_db.get('properties', {}))
+        if not properties_to_update:
+            log.info("No changes for database '%s'.", title)
+            return
 
     else:
-        print(f"Unknown update mode: {update_mode}. Skipping update.")
+        log.warning("Unknown update mode: %s. Skipping update.", update_mode)
         return
 
     notion_client.databases.update(database_id=db_id, properties=properties_to_update)
-    print(f"Successfully updated database '{db_config.get('title')}'.")
+    log.info("Successfully updated database '%s'.", title)
+
+
+def _validate_schema(schema):
+    """
+    Checks the whole schema and builds every database's properties, without any API call.
+    Returns a `(properties_by_db_key, errors)` tuple.
+    """
+    properties_by_db_key = {}
+    errors = []
+    for db_config in schema.get('databases', []):
+        db_title = db_config.get('title')
+        db_key = db_config.get('db_key')
+        if not db_key:
+            errors.append(f"Database '{db_title}' is missing a `db_key`.")
+            continue
+        if db_key in properties_by_db_key:
+            errors.append(f"Database '{db_title}' uses the `db_key` '{db_key}' of another database.")
+            continue
+        # Each property is built on its own, so that every invalid one is reported
+        properties = {}
+        for name, prop in db_config.get('properties', {}).items():
+            try:
+                properties[name] = _property_builder(name, prop)(name, prop)
+            except ValueError as e:
+                errors.append(f"Database '{db_title}': {e}")
+        properties_by_db_key[db_key] = properties
+
+    db_keys = {db_config.get('db_key') for db_config in schema.get('databases', [])}
+    for relation_config in schema.get('relations', []):
+        from_db_key = relation_config.get('from_db')
+        to_db_key = relation_config.get('to_db')
+        # Only databases of the schema can be related, so these would fail after the databases are written
+        if relation_config.get('on_missing', 'skip') == 'error' and not {from_db_key, to_db_key} <= db_keys:
+            errors.append(f"Could not find one or both databases for relation: '{from_db_key}' -> '{to_db_key}'")
 
+    return properties_by_db_key, errors
 
 def apply_schema_to_notion(schema, notion_client, dry_run=False):
     """
@@ -111,6 +253,16 @@ def apply_schema_to_notion(schema, notion_client, dry_run=False):
     if not parent_page_id:
         raise ValueError("A `parent_page_id` must be defined under `workspace` in your schema.")
 
+    # Every problem is reported before anything is written, so an invalid schema
+    # cannot leave the workspace partially updated
+    properties_by_db_key, errors = _validate_schema(schema)
+    if errors:
+        raise ValueError("Invalid schema:\n" + "\n".join(f"- {error}" for error in errors))
+
+    # All existing databases are listed with one paginated search, instead of one search per database
+    existing_by_title = {} if dry_run else index_databases_by_title(notion_client)
+    database_writes = []
+
     for db_config in schema.get('databases', []):
         db_title = db_config.get('title')
         match_rule = db_config.get('match', {'by': 'title', 'value': db_title})
@@ -122,33 +274,49 @@ def apply_schema_to_notion(schema, notion_client, dry_run=False):
                 # In dry run, we assume it doesn't exist to show creation plan
                 existing_db = None
             else:
-                existing_db = find_database_by_title(notion_client, match_rule.get('value'))
+                existing_db = existing_by_title.get((match_rule.get('value') or '').casefold())
 
         db_key = db_config.get('db_key')
-        if not db_key:
-            raise ValueError(f"Database '{db_title}' is missing a `db_key`.")
+        properties = properties_by_db_key[db_key]
 
         if existing_db:
             db_key_to_id_map[db_key] = existing_db['id']
-            update_mode = db_config.get('update_mode', 'merge')
             if dry_run:
+                update_mode = db_config.get('update_mode', 'merge')
                 plan.append(f"  - Plan to UPDATE database: '{db_title}' (mode: {update_mode})")
             else:
-                print(f"Updating database: '{db_title}' (mode: {update_mode})...")
-                _update_database(notion_client, existing_db, db_config, update_mode)
+                database_writes.append((db_key, db_config, existing_db, properties))
         else:
             if dry_run:
                 plan.append(f"  - Plan to CREATE database: '{db_title}'")
                 # In dry run, we don't have an ID, so we use a placeholder
                 db_key_to_id_map[db_key] = f"new_db_for_{db_key}"
             else:
-                print(f"Creating database: '{db_title}'...")
-                created_db = _create_database(notion_client, parent_page_id, db_config)
-                db_id = created_db['id']
-                db_key_to_id_map[db_key] = db_id
-                print(f"Successfully created database '{db_title}' with ID: {db_id}")
+                database_writes.append((db_key, db_config, None, properties))
+
+    def write_database(write):
+        db_key, db_config, existing_db, properties = write
+        db_title = db_config.get('title')
+        if existing_db:
+            update_mode = db_config.get('update_mode', 'merge')
+            log.info("Updating database: '%s' (mode: %s)...", db_title, update_mode)
+            _update_database(notion_client, existing_db, db_title, properties, update_mode)
+        else:
+            log.info("Creating database: '%s'...", db_title)
+            db_id = _create_database(notion_client, parent_page_id, db_title, properties)['id']
+            db_key_to_id_map[db_key] = db_id
+            log.info("Successfully created database '%s' with ID: %s", db_title, db_id)
+
+    # Databases are independent of each other, so they are written concurrently.
+    # All of them must exist before any relation can point to them.
+    _, errors = run_concurrently(write_database, database_writes)
+    for (_, db_config, _, _), error in errors:
+        log.error("Error: Failed to write database '%s': %s", db_config.get('title'), error)
+    if errors:
+        raise errors[0][1]
 
     # Handle relations after all databases are processed
+    pending_relations = defaultdict(dict)
     for relation_config in schema.get('relations', []):
         from_db_key = relation_config.get('from_db')
         to_db_key = relation_config.get('to_db')
@@ -162,38 +330,35 @@ def apply_schema_to_notion(schema, notion_client, dry_run=False):
             if on_missing == 'error':
                 raise ValueError(f"Could not find one or both databases for relation: '{from_db_key}' -> '{to_db_key}'")
             else:
-                print(f"Skipping relation '{from_db_key}' -> '{to_db_key}' because one or both databases were not found.")
+                log.warning("Skipping relation '%s' -> '%s' because one or both databases were not found.", from_db_key, to_db_key)
                 continue
 
-        relation_property = {
-            "type": "relation",
-            "relation": {
-                "database_id": to_db_id,
-                "single_property": {}  # Use single_property for one-way relations
-            }
-        }
-
-        synced_property_name = relation_config.get('synced_property_name')
-        if synced_property_name:
-            # If we have a synced property name, it's a dual relation
-            relation_property['relation'] = {
-                "database_id": to_db_id,
-                "dual_property": {
-                    "synced_property_name": synced_property_name
-                }
-            }
-
         if dry_run:
             plan.append(f"  - Plan to CREATE RELATION '{property_name}' on '{from_db_key}' to '{to_db_key}'")
         else:
-            print(f"Creating relation '{property_name}' on '{from_db_key}'...")
-            notion_client.databases.update(
-                database_id=from_db_id,
-                properties={
-                    property_name: relation_property
-                }
-            )
-            print(f"Successfully created relation on '{from_db_key}'.")
+            synced_property_name = relation_config.get('synced_property_name')
+            if synced_property_name:
+                # If we have a synced property name, it's a dual relation
+                relation = {"database_id": to_db_id, "dual_property": {"synced_property_name": synced_property_name}}
+            else:
+                # Use single_property for one-way relations
+                relation = {"database_id": to_db_id, "single_property": {}}
+            relation_property = {"type": "relation", "relation": relation}
+
+            # Relations on the same database are sent together in a single update
+            pending_relations[(from_db_key, from_db_id)][property_name] = relation_property
+
+    def write_relations(item):
+        (from_db_key, from_db_id), relation_properties = item
+        log.info("Creating relations %s on '%s'...", list(relation_properties), from_db_key)
+        notion_client.databases.update(database_id=from_db_id, properties=relation_properties)
+        log.info("Successfully created relations on '%s'.", from_db_key)
+
+    _, errors = run_concurrently(write_relations, list(pending_relations.items()))
+    for ((from_db_key, _), _), error in errors:
+        log.error("Error: Failed to create relations on '%s': %s", from_db_key, error)
+    if errors:
+        raise errors[0][1]
 
     if dry_run:
         return plan
@@ -0,0 +1,11 @@
+import yaml
+
+# Use the libyaml-backed loader when PyYAML was built against it;
+# it accepts exactly the same documents as SafeLoader.
+_SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+def safe_load(stream):
+    """
+    Parses a YAML document from a string, bytes or a file object.
+    """
+    return yaml.load(stream, Loader=_SafeLoader)
@@ -0,0 +1,10 @@
+import pytest
+
+from src.cache import enable_persistent_cache, disable_persistent_cache
+
+@pytest.fixture
+def persistent_cache(tmp_path):
+    """Enables the persistent cache in a temporary file for the duration of a test."""
+    enable_persistent_cache(str(tmp_path / "cache.sqlite"))
+    yield
+    disable_persistent_cache()
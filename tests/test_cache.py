@@ -0,0 +1,122 @@
+import datetime
+import os
+import pickle
+import sqlite3
+
+from src.cache import cache_get, cache_set, cached_by_file
+
+def test_cache_stores_values_as_json(persistent_cache, tmp_path):
+    """
+    Tests that values are stored as JSON text and read back.
+    """
+    cache_set('test', 'key', {"id": "db_id"})
+
+    with sqlite3.connect(str(tmp_path / "cache.sqlite")) as conn:
+        (stored,) = conn.execute("SELECT value FROM cache WHERE namespace = 'test'").fetchone()
+    conn.close()
+
+    assert stored == '{"id": "db_id"}'
+    assert cache_get('test', 'key') == {"id": "db_id"}
+
+def test_cache_never_unpickles_entries(persistent_cache, tmp_path):
+    """
+    Tests that a pickled entry planted in the cache file is treated as a miss, not loaded.
+    """
+    with sqlite3.connect(str(tmp_path / "cache.sqlite")) as conn:
+        conn.execute(
+            "INSERT INTO cache (namespace, key, value) VALUES (?, ?, ?)",
+            ('database_ids', 'customers', pickle.dumps(("planted", "value"))),
+        )
+    conn.close()
+
+    assert cache_get('database_ids', 'customers') is None
+
+def test_cache_treats_a_removed_file_as_a_miss(persistent_cache, tmp_path):
+    """
+    Tests that the cache keeps working, as misses, when its file disappears during a run.
+    """
+    cache_set('test', 'key', "value")
+    os.remove(tmp_path / "cache.sqlite")
+
+    assert cache_get('test', 'key') is None
+    cache_set('test', 'key', "value")
+
+def test_cached_by_file_reuses_result_until_file_changes(persistent_cache, tmp_path):
+    """
+    Tests that a file is only parsed again once its modification time or size changes.
+    """
+    calls = []
+
+    @cached_by_file('test_files')
+    def parse(path):
+        calls.append(path)
+        with open(path) as f:
+            return f.read()
+
+    data_file = tmp_path / "data.txt"
+    data_file.write_text("first")
+
+    assert parse(str(data_file)) == "first"
+    assert parse(str(data_file)) == "first"
+    assert len(calls) == 1
+
+    data_file.write_text("second!")
+    os.utime(data_file, ns=(0, 0))
+
+    assert parse(str(data_file)) == "second!"
+    assert len(calls) == 2
+
+def test_cached_by_file_is_a_passthrough_when_disabled(tmp_path):
+    """
+    Tests that nothing is cached while the persistent cache is disabled.
+    """
+    calls = []
+
+    @cached_by_file('test_files')
+    def parse(path):
+        calls.append(path)
+        return path
+
+    parse(str(tmp_path))
+    parse(str(tmp_path))
+
+    assert len(calls) == 2
+
+def test_cached_by_file_restores_dates(persistent_cache, tmp_path):
+    """
+    Tests that dates parsed from a file come back as dates from the cache.
+    """
+    calls = []
+
+    @cached_by_file('test_files')
+    def parse(path):
+        calls.append(path)
+        return {"due": datetime.date(2024, 1, 31), "at": datetime.datetime(2024, 1, 31, 12, 30)}, "body"
+
+    data_file = tmp_path / "data.md"
+    data_file.write_text("content")
+
+    first = parse(str(data_file))
+    front_matter, body = parse(str(data_file))
+
+    assert len(calls) == 1
+    assert front_matter == first[0]
+    assert body == "body"
+
+def test_cached_by_file_skips_values_json_would_change(persistent_cache, tmp_path):
+    """
+    Tests that results with non-string keys are parsed again rather than cached with string keys.
+    """
+    calls = []
+
+    @cached_by_file('test_files')
+    def parse(path):
+        calls.append(path)
+        return {1: "one"}
+
+    data_file = tmp_path / "data.yaml"
+    data_file.write_text("1: one")
+
+    assert parse(str(data_file)) == {1: "one"}
+    assert parse(str(data_file)) == {1: "one"}
+    assert len(calls) == 2
@@ -0,0 +1,110 @@
+import json
+
+import httpx
+import pytest
+
+from src.client import NotionClient
+
+@pytest.fixture
+def requests_seen():
+    """Collects the requests sent through the mock transport."""
+    return []
+
+@pytest.fixture
+def client(requests_seen):
+    """A NotionClient whose HTTP traffic goes to an in-memory transport."""
+    def handler(request):
+        requests_seen.append(request)
+        if request.url.path.endswith('/missing'):
+            return httpx.Response(404, json={"object": "error", "code": "object_not_found", "message": "Not found"})
+        return httpx.Response(200, json={"object": "block", "id": "block_id", "results": []})
+
+    return NotionClient(auth="secret", client=httpx.Client(transport=httpx.MockTransport(handler)))
+
+def test_request_body_is_sent_as_json(client, requests_seen):
+    """
+    Tests that request bodies are encoded as JSON with the right content type.
+    """
+    children = [{"type": "paragraph", "paragraph": {"rich_text": [{"text": {"content": "é"}}]}}]
+
+    response = client.blocks.children.append(block_id="page_id", children=children)
+
+    assert response['id'] == "block_id"
+    request = requests_seen[0]
+    assert request.headers['Content-Type'] == "application/json"
+    assert request.headers['Authorization'] == "Bearer secret"
+    assert json.loads(request.content) == {"children": children}
+
+def test_database_update_body_is_sent_as_json(client, requests_seen):
+    """
+    Tests that schema payloads such as database updates go through the same encoding.
+    """
+    properties = {"Status": {"select": {"options": [{"name": "Done"}]}}, "Due": {"date": {}}}
+
+    client.databases.update(database_id="db_id", properties=properties)
+
+    request = requests_seen[0]
+    assert request.method == "PATCH"
+    assert request.headers['Content-Type'] == "application/json"
+    assert json.loads(request.content) == {"properties": properties}
+
+def test_error_response_raises_api_error(client):
+    """
+    Tests that error responses still raise the notion_client API error.
+    """
+    from notion_client import APIResponseError
+
+    with pytest.raises(APIResponseError):
+        client.request(path="missing", method="GET")
+
+def test_rate_limited_request_is_retried(monkeypatch):
+    """
+    Tests that a rate limited request is sent again after the wait Notion asks for.
+    """
+    # Arrange
+    delays = []
+    monkeypatch.setattr("src.client.time.sleep", delays.append)
+    responses = [
+        httpx.Response(429, headers={"Retry-After": "2"}, json={"object": "error", "code": "rate_limited", "message": "Slow down"}),
+        httpx.Response(200, json={"object": "block", "id": "block_id"}),
+    ]
+    client = NotionClient(auth="secret", client=httpx.Client(transport=httpx.MockTransport(lambda request: responses.pop(0))))
+
+    # Act
+    response = client.blocks.retrieve(block_id="block_id")
+
+    # Assert
+    assert response['id'] == "block_id"
+    assert delays == [2.0]
+
+def test_rate_limited_request_gives_up_after_retries(monkeypatch):
+    """
+    Tests that the rate limit error is raised once the retries are used up.
+    """
+    from notion_client import APIResponseError
+    from src.client import RATE_LIMIT_RETRIES
+
+    # Arrange
+    delays = []
+    monkeypatch.setattr("src.client.time.sleep", delays.append)
+    client = NotionClient(auth="secret", client=httpx.Client(transport=httpx.MockTransport(
+        lambda request: httpx.Response(429, json={"object": "error", "code": "rate_limited", "message": "Slow down"})
+    )))
+
+    # Act / Assert
+    with pytest.raises(APIResponseError):
+        client.blocks.retrieve(block_id="block_id")
+    assert delays == [1, 2, 4, 8, 16][:RATE_LIMIT_RETRIES]
+
+def test_requests_are_logged_like_the_stock_client(client, caplog):
+    """
+    Tests that requests sent with orjson are still logged by the client's logger.
+    """
+    import logging
+
+    with caplog.at_level(logging.DEBUG, logger=client.logger.name):
+        client.blocks.children.append(block_id="page_id", children=[])
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(message.startswith("PATCH ") and message.endswith("blocks/page_id/children") for message in messages)
+    assert any(message.startswith("=> ") and "'children': []" in message for message in messages)
@@ -1,7 +1,7 @@
 import pytest
 from unittest.mock import MagicMock, patch
 
-from src.ingestion import ingest_data_to_notion
+from src.ingestion import ingest_data_to_notion, _index_pages_by_property
 
 @pytest.fixture
 def mock_notion_client():
@@ -55,7 +55,12 @@ def test_ingest_yaml_update_page(mock_notion_client, yaml_data):
     Tests that an existing page is updated from YAML data.
     """
     # Arrange: Simulate that the page exists
-    existing_page = {"id": "existing_page_id"}
+    existing_page = {
+        "id": "existing_page_id",
+        "properties": {
+            "External ID": {"type": "rich_text", "rich_text": [{"plain_text": "cust-001"}]}
+        }
+    }
     mock_notion_client.databases.query.return_value = {"results": [existing_page]}
 
     # Act
@@ -88,6 +93,25 @@ def test_ingest_creates_new_select_option(mock_notion_client, yaml_data):
     assert {'name': 'Active'} in options
     assert {'name': 'Prospect'} in options
 
+def test_ingest_adds_new_select_options_in_one_update(mock_notion_client, yaml_data):
+    """
+    Tests that new select options from several records are added with a single update.
+    """
+    # Arrange
+    yaml_data['data']['customers'] += [
+        {"external_id": "cust-002", "Name": "Other Corp", "Status": "Churned"},
+        {"external_id": "cust-003", "Name": "Third Corp", "Status": "Prospect"},
+    ]
+    mock_notion_client.databases.query.return_value = {"results": []}
+
+    # Act
+    ingest_data_to_notion(yaml_data, mock_notion_client, dry_run=False)
+
+    # Assert
+    mock_notion_client.databases.update.assert_called_once()
+    options = mock_notion_client.databases.update.call_args.kwargs['properties']['Status']['select']['options']
+    assert options == [{'name': 'Active'}, {'name': 'Prospect'}, {'name': 'Churned'}]
+
 @pytest.fixture
 def csv_data():
     """Sample CSV data for testing."""
@@ -126,9 +150,77 @@ def test_ingest_csv_data(mock_notion_client, csv_data, map_config):
     assert 'external_id' in properties
     assert properties['external_id']['rich_text'][0]['text']['content'] == "cust-002"
 
+def test_ingest_csv_rows_from_iterator(mock_notion_client, csv_data, map_config):
+    """
+    Tests that streamed CSV rows (an iterator rather than a list) are ingested.
+    """
+    # Arrange
+    mock_notion_client.databases.query.return_value = {"results": []}
+
+    # Act
+    ingest_data_to_notion(iter(csv_data), mock_notion_client, map_config, dry_run=False)
+
+    # Assert
+    mock_notion_client.pages.create.assert_called_once()
+
 def test_ingest_csv_requires_map(mock_notion_client, csv_data):
     """
     Tests that CSV ingestion raises an error if no map file is provided.
     """
     with pytest.raises(ValueError, match="A map file is required for CSV ingestion."):
         ingest_data_to_notion(csv_data, mock_notion_client)
+
+def test_ingest_failed_write_does_not_abort_batch(mock_notion_client, yaml_data):
+    """
+    Tests that a failing page write does not prevent the other writes in the batch,
+    and that the failure is raised once they are done.
+    """
+    # Arrange
+    yaml_data['data']['customers'].append({"external_id": "cust-002", "Name": "Other Corp"})
+    mock_notion_client.databases.query.return_value = {"results": []}
+    mock_notion_client.pages.create.side_effect = [Exception("API error"), {"id": "new_page_id"}]
+
+    # Act
+    with pytest.raises(Exception, match="API error"):
+        ingest_data_to_notion(yaml_data, mock_notion_client, dry_run=False)
+
+    # Assert
+    assert mock_notion_client.pages.create.call_count == 2
+
+def test_ingest_queries_database_once(mock_notion_client, yaml_data):
+    """
+    Tests that existing pages are fetched once per database rather than once per record.
+    """
+    # Arrange
+    yaml_data['data']['customers'].append({"external_id": "cust-002", "Name": "Other Corp"})
+    mock_notion_client.databases.query.return_value = {"results": []}
+
+    # Act
+    ingest_data_to_notion(yaml_data, mock_notion_client, dry_run=False)
+
+    # Assert
+    mock_notion_client.databases.query.assert_called_once()
+    assert mock_notion_client.pages.create.call_count == 2
+
+def test_index_pages_requests_only_match_property(mock_notion_client):
+    """
+    Tests that the page index asks for the match property only and follows pagination.
+    """
+    # Arrange
+    def page(page_id, external_id):
+        return {"id": page_id, "properties": {
+            "External ID": {"id": "ext", "type": "rich_text", "rich_text": [{"plain_text": external_id}]}
+        }}
+    mock_notion_client.databases.query.side_effect = [
+        {"results": [page("page_1", "cust-001")], "has_more": True, "next_cursor": "cursor_1"},
+        {"results": [page("page_2", "cust-002")], "has_more": False},
+    ]
+
+    # Act
+    index = _index_pages_by_property(mock_notion_client, "test_db_id", "External ID", "ext")
+
+    # Assert
+    assert index == {"cust-001": {"id": "page_1"}, "cust-002": {"id": "page_2"}}
+    last_query = mock_notion_client.databases.query.call_args.kwargs
+    assert last_query['filter_properties'] == ["ext"]
+    assert last_query['start_cursor'] == "cursor_1"
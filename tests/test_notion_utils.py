@@ -0,0 +1,89 @@
+import pytest
+from unittest.mock import MagicMock
+
+from src import notion_utils
+from src.notion_utils import find_database_by_title
+
+@pytest.fixture
+def mock_notion_client():
+    """Pytest fixture for a mocked Notion client."""
+    return MagicMock()
+
+def test_find_database_by_title_follows_pagination(mock_notion_client):
+    """
+    Tests that search results are paginated until the exact title is found.
+    """
+    # Arrange
+    mock_notion_client.search.side_effect = [
+        {"results": [{"id": "other_db_id", "title": [{"plain_text": "Customers Archive"}]}],
+         "has_more": True, "next_cursor": "cursor_1"},
+        {"results": [{"id": "db_id", "title": [{"plain_text": "CUSTOMERS"}]}], "has_more": False},
+    ]
+
+    # Act
+    db = find_database_by_title(mock_notion_client, "Customers")
+
+    # Assert
+    assert db['id'] == "db_id"
+    assert mock_notion_client.search.call_args.kwargs['start_cursor'] == "cursor_1"
+
+def test_find_database_by_title_is_cached(mock_notion_client):
+    """
+    Tests that a database found once is not searched for again.
+    """
+    # Arrange
+    mock_notion_client.options.auth = "token_is_cached"
+    mock_notion_client.search.return_value = {"results": [{"id": "db_id", "title": [{"plain_text": "Customers"}]}]}
+
+    # Act
+    first = find_database_by_title(mock_notion_client, "Customers")
+    second = find_database_by_title(mock_notion_client, "customers")
+
+    # Assert
+    assert first is second
+    mock_notion_client.search.assert_called_once()
+
+def test_find_database_by_title_reuses_persisted_id(persistent_cache):
+    """
+    Tests that a database id remembered by a previous run is retrieved without searching.
+    """
+    # Arrange: a first run finds the database by searching
+    db = {"id": "db_id", "title": [{"plain_text": "Customers"}]}
+    first_run_client = MagicMock()
+    first_run_client.search.return_value = {"results": [db]}
+    find_database_by_title(first_run_client, "Customers")
+
+    second_run_client = MagicMock()
+    second_run_client.databases.retrieve.return_value = db
+
+    # Act
+    found = find_database_by_title(second_run_client, "Customers")
+
+    # Assert
+    assert found['id'] == "db_id"
+    second_run_client.databases.retrieve.assert_called_once_with(database_id="db_id")
+    second_run_client.search.assert_not_called()
+
+def test_database_cache_is_bounded_and_drops_expired_entries(monkeypatch):
+    """
+    Tests that the in-memory cache keeps at most DATABASE_CACHE_SIZE entries and forgets expired ones.
+    """
+    # Arrange
+    monkeypatch.setattr(notion_utils, "DATABASE_CACHE_SIZE", 2)
+    monkeypatch.setattr(notion_utils, "_database_cache", notion_utils.OrderedDict())
+    client = MagicMock()
+    client.options.auth = "token_is_bounded"
+    client.search.side_effect = lambda **kwargs: {"results": [{"id": kwargs['query'], "title": [{"plain_text": kwargs['query']}]}]}
+
+    # Act
+    for title in ("A", "B", "C"):
+        find_database_by_title(client, title)
+
+    # Assert
+    assert [key[1] for key in notion_utils._database_cache] == ["b", "c"]
+
+    monkeypatch.setattr(notion_utils, "DATABASE_CACHE_TTL", -1)
+    find_database_by_title(client, "D")
+    find_database_by_title(client, "D")
+    assert client.search.call_count == 5
+    assert ("token_is_bounded", "d") in notion_utils._database_cache
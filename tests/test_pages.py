@@ -3,7 +3,9 @@ from unittest.mock import MagicMock, patch
 from pathlib import Path
 import os
 
-from src.pages import publish_pages_to_notion, _parse_markdown_file
+from src.pages import (
+    publish_pages_to_notion, _parse_markdown_file, _update_page_blocks, _markdown_to_notion_blocks, _iter_markdown_files
+)
 
 @pytest.fixture
 def mock_notion_client():
@@ -27,6 +29,19 @@ def pages_dir(tmp_path):
     )
     return pages
 
+def test_iter_markdown_files_is_recursive(pages_dir):
+    """
+    Tests that markdown files in subdirectories are found and other files are ignored.
+    """
+    nested = pages_dir / "team" / "notes"
+    nested.mkdir(parents=True)
+    (nested / "nested_page.md").write_text("# Nested")
+    (nested / "image.png").write_bytes(b"")
+
+    found = sorted(p.relative_to(pages_dir).as_posix() for p in _iter_markdown_files(pages_dir))
+
+    assert found == ["team/notes/nested_page.md", "test_page.md"]
+
 def test_parse_markdown_file(pages_dir):
     """
     Tests that the markdown file is parsed correctly.
@@ -38,12 +53,58 @@ def test_parse_markdown_file(pages_dir):
     assert front_matter['parent_page_id'] == 'test_parent_id'
     assert body == "# Hello\n\nThis is a test."
 
+def test_parse_markdown_file_without_front_matter(tmp_path):
+    """
+    Tests that a file without front matter is returned whole as the body.
+    """
+    file_path = tmp_path / "plain.md"
+    file_path.write_text("# Hello\n\n---\n\nAfter a rule.")
+
+    front_matter, body = _parse_markdown_file(file_path)
+
+    assert front_matter == {}
+    assert body == "# Hello\n\n---\n\nAfter a rule."
+
+def test_parse_markdown_file_with_byte_order_mark(tmp_path):
+    """
+    Tests that front matter is found after a UTF-8 byte order mark, and that the mark is dropped.
+    """
+    with_front_matter = tmp_path / "bom.md"
+    with_front_matter.write_bytes(b"\xef\xbb\xbf---\ntitle: T\nparent_page_id: p\n---\nBody")
+    without_front_matter = tmp_path / "bom_plain.md"
+    without_front_matter.write_bytes(b"\xef\xbb\xbf# Hello")
+
+    assert _parse_markdown_file(with_front_matter) == ({'title': 'T', 'parent_page_id': 'p'}, "Body")
+    assert _parse_markdown_file(without_front_matter) == ({}, "# Hello")
+
+def test_markdown_to_notion_blocks():
+    """
+    Tests that headings and paragraphs, including nested ones, become Notion blocks.
+    """
+    blocks = _markdown_to_notion_blocks("# Title\n\nIntro\n\n- item\n\n> quote\n\n#### Too deep")
+
+    assert [b['type'] for b in blocks] == ['heading_1', 'paragraph', 'paragraph', 'paragraph']
+    contents = [b[b['type']]['rich_text'][0]['text']['content'] for b in blocks]
+    assert contents == ['Title', 'Intro', 'item', 'quote']
+
+def test_markdown_to_notion_blocks_many_containers():
+    """
+    Tests that documents with many consecutive and nested containers convert in order.
+    """
+    md_body = "\n\n".join(f"> Quote {i}\n>\n> - Item {i}" for i in range(200))
+
+    blocks = _markdown_to_notion_blocks(md_body)
+
+    contents = [b['paragraph']['rich_text'][0]['text']['content'] for b in blocks]
+    assert contents[:4] == ['Quote 0', 'Item 0', 'Quote 1', 'Item 1']
+    assert len(contents) == 400
+
 def test_publish_creates_new_page(mock_notion_client, pages_dir):
     """
     Tests that a new page is created when it doesn't exist.
     """
-    # Arrange: Simulate that the page does not exist
-    mock_notion_client.search.return_value = {"results": []}
+    # Arrange: Simulate that the page does not exist under its parent
+    mock_notion_client.blocks.children.list.return_value = {"results": []}
 
     # Act
     publish_pages_to_notion(pages_dir, mock_notion_client)
@@ -62,25 +123,18 @@ def test_publish_updates_existing_page(mock_notion_client, pages_dir):
     """
     Tests that an existing page is updated.
     """
-    # Arrange: Simulate that the page exists
+    # Arrange: Simulate that the page exists under its parent
     existing_page = {
         "id": "existing_page_id",
-        "parent": {"type": "page_id", "page_id": "test_parent_id"},
-        "properties": {
-            "title": {
-                "id": "title",
-                "type": "title",
-                "title": [{
-                    "type": "text",
-                    "text": {"content": "Test Page"},
-                    "plain_text": "Test Page"
-                }]
-            }
-        }
+        "type": "child_page",
+        "child_page": {"title": "Test Page"}
     }
-    mock_notion_client.search.return_value = {"results": [existing_page]}
-    # Mock the block children list and delete
-    mock_notion_client.blocks.children.list.return_value = {"results": [{"id": "block1"}]}
+    # Mock the block children list (of the parent and of the page) and delete
+    children = {
+        "test_parent_id": {"results": [existing_page]},
+        "existing_page_id": {"results": [{"id": "block1"}]},
+    }
+    mock_notion_client.blocks.children.list.side_effect = lambda block_id, **kwargs: children[block_id]
 
     # Act
     publish_pages_to_notion(pages_dir, mock_notion_client)
@@ -89,7 +143,93 @@ def test_publish_updates_existing_page(mock_notion_client, pages_dir):
     mock_notion_client.pages.create.assert_not_called()
     # Called once to update properties
     mock_notion_client.pages.update.assert_called_once()
-    # Called to update blocks
-    mock_notion_client.blocks.children.list.assert_called_once()
+    # Called once to find the page under its parent, and once to update its blocks
+    assert mock_notion_client.blocks.children.list.call_count == 2
+    mock_notion_client.search.assert_not_called()
     mock_notion_client.blocks.delete.assert_called_once()
     mock_notion_client.blocks.children.append.assert_called_once()
+
+def test_update_page_blocks_deletes_all_and_appends_in_chunks(mock_notion_client):
+    """
+    Tests that every existing block is deleted and new blocks are appended 100 at a time.
+    """
+    # Arrange
+    mock_notion_client.blocks.children.list.return_value = {"results": [{"id": "block1"}, {"id": "block2"}]}
+    new_blocks = [{"type": "paragraph", "paragraph": {}} for _ in range(250)]
+
+    # Act
+    _update_page_blocks(mock_notion_client, "page_id", new_blocks)
+
+    # Assert
+    assert mock_notion_client.blocks.delete.call_count == 2
+    appended = [c.kwargs['children'] for c in mock_notion_client.blocks.children.append.call_args_list]
+    assert [len(chunk) for chunk in appended] == [100, 100, 50]
+
+def test_update_page_blocks_skips_unchanged_content(mock_notion_client):
+    """
+    Tests that blocks are not rewritten when the page already has the same content.
+    """
+    # Arrange
+    mock_notion_client.blocks.children.list.return_value = {"results": [{
+        "id": "block1",
+        "type": "paragraph",
+        "has_children": False,
+        "paragraph": {"rich_text": [{"type": "text", "text": {"content": "Same"}, "plain_text": "Same"}]}
+    }]}
+
+    # Act
+    _update_page_blocks(mock_notion_client, "page_id", _markdown_to_notion_blocks("Same"))
+
+    # Assert
+    mock_notion_client.blocks.delete.assert_not_called()
+    mock_notion_client.blocks.children.append.assert_not_called()
+
+def test_publish_creates_long_page_in_chunks(mock_notion_client, pages_dir):
+    """
+    Tests that a page with more than 100 blocks is created with the first 100
+    and the rest appended afterwards.
+    """
+    # Arrange
+    (pages_dir / "test_page.md").write_text(
+        "---\ntitle: 'Long Page'\nparent_page_id: 'test_parent_id'\n---\n"
+        + "\n\n".join(f"Paragraph {i}" for i in range(150))
+    )
+    mock_notion_client.blocks.children.list.return_value = {"results": []}
+    mock_notion_client.pages.create.return_value = {"id": "new_page_id"}
+
+    # Act
+    publish_pages_to_notion(pages_dir, mock_notion_client)
+
+    # Assert
+    assert len(mock_notion_client.pages.create.call_args.kwargs['children']) == 100
+    mock_notion_client.blocks.children.append.assert_called_once()
+    append_args = mock_notion_client.blocks.children.append.call_args
+    assert append_args.kwargs['block_id'] == "new_page_id"
+    assert len(append_args.kwargs['children']) == 50
+
+def test_publish_raises_after_attempting_every_page(mock_notion_client, pages_dir):
+    """
+    Tests that a failing page does not stop the others, and that the failure is raised afterwards.
+    """
+    # Arrange
+    (pages_dir / "other_page.md").write_text(
+        "---\n"
+        "title: 'Other Page'\n"
+        "parent_page_id: 'test_parent_id'\n"
+        "---\n"
+        "Other content."
+    )
+    mock_notion_client.blocks.children.list.return_value = {"results": []}
+
+    def create(**kwargs):
+        if kwargs['properties']['title'][0]['text']['content'] == 'Test Page':
+            raise RuntimeError("API error")
+        return {"id": "new_page_id"}
+    mock_notion_client.pages.create.side_effect = create
+
+    # Act
+    with pytest.raises(RuntimeError, match="API error"):
+        publish_pages_to_notion(pages_dir, mock_notion_client)
+
+    # Assert
+    assert mock_notion_client.pages.create.call_count == 2
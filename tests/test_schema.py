@@ -1,4 +1,7 @@
-from src.schema import load_schema
+import pytest
+import yaml
+
+from src.schema import load_schema, peek_schema_header
 
 def test_load_schema():
     """
@@ -8,3 +11,67 @@ def test_load_schema():
     assert schema is not None
     assert 'version' in schema
     assert 'databases' in schema
+
+def test_load_schema_returns_independent_copies():
+    """
+    Tests that cached schemas can be modified by a caller without affecting later loads.
+    """
+    schema = load_schema('schema.yaml')
+    schema['databases'].clear()
+
+    assert load_schema('schema.yaml')['databases']
+
+def test_peek_schema_header_stops_after_header(tmp_path):
+    """
+    Tests that the header is read without parsing the rest of the document.
+    """
+    # Arrange
+    # The trailing document is invalid YAML, so a full parse of it would fail
+    schema_file = tmp_path / 'schema.yaml'
+    schema_file.write_text(
+        "version: '1.0'\n"
+        "workspace:\n"
+        "  parent_page_id: abc\n"
+        "databases: [unterminated\n"
+    )
+
+    # Act
+    header = peek_schema_header(schema_file)
+
+    # Assert
+    assert header == {'version': '1.0', 'workspace': {'parent_page_id': 'abc'}}
+
+def test_peek_schema_header_loads_whole_file_when_header_is_incomplete(tmp_path):
+    """
+    Tests that a key after the databases is still found, by falling back to a full load.
+    """
+    # Arrange
+    schema_file = tmp_path / 'schema.yaml'
+    schema_file.write_text(
+        "version: '1.0'\n"
+        "databases: []\n"
+        "workspace:\n"
+        "  parent_page_id: abc\n"
+    )
+
+    # Act
+    header = peek_schema_header(schema_file)
+
+    # Assert
+    assert header == {'version': '1.0', 'workspace': {'parent_page_id': 'abc'}}
+
+def test_peek_schema_header_with_unhashable_key(tmp_path):
+    """
+    Tests that a complex top-level key falls back to the full load rather than a TypeError.
+    """
+    # Arrange
+    schema_file = tmp_path / 'schema.yaml'
+    schema_file.write_text(
+        "? [a, b]\n"
+        ": 1\n"
+        "version: '1.0'\n"
+    )
+
+    # Act / Assert: the full load rejects the key like any other invalid YAML
+    with pytest.raises(yaml.YAMLError):
+        peek_schema_header(schema_file)
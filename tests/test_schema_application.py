@@ -136,3 +136,176 @@ def test_missing_parent_page_id_raises_error(mock_notion_client):
     schema = {"workspace": {}, "databases": []}
     with pytest.raises(ValueError, match="A `parent_page_id` must be defined"):
         apply_schema_to_notion(schema, mock_notion_client)
+
+def test_invalid_number_format_raises_error(mock_notion_client, basic_schema):
+    """
+    Tests that a ValueError is raised for a number format Notion does not support.
+    """
+    basic_schema['databases'][0]['properties']['Amount'] = {"type": "number", "format": "doubloons"}
+    mock_notion_client.search.return_value = {"results": []}
+
+    with pytest.raises(ValueError, match="Invalid number format 'doubloons' for property 'Amount'"):
+        apply_schema_to_notion(basic_schema, mock_notion_client)
+
+def test_apply_schema_searches_once_for_all_databases(mock_notion_client):
+    """
+    Tests that existing databases are found with a single search, whatever their number.
+    """
+    schema = {
+        "workspace": {"parent_page_id": "test_parent_page_id"},
+        "databases": [
+            {"db_key": "customers", "title": "Customers", "properties": {"Name": {"type": "title"}}},
+            {"db_key": "orders", "title": "Orders", "properties": {"Order No": {"type": "title"}}}
+        ]
+    }
+    mock_notion_client.search.return_value = {"results": [
+        {"id": "customers_db_id", "title": [{"plain_text": "Customers"}], "properties": {}},
+        {"id": "orders_db_id", "title": [{"plain_text": "orders"}], "properties": {}},
+    ]}
+
+    apply_schema_to_notion(schema, mock_notion_client, dry_run=False)
+
+    mock_notion_client.search.assert_called_once()
+    mock_notion_client.databases.create.assert_not_called()
+    updated_ids = {c.kwargs['database_id'] for c in mock_notion_client.databases.update.call_args_list}
+    assert updated_ids == {"customers_db_id", "orders_db_id"}
+
+def test_relations_on_same_database_are_sent_together(mock_notion_client):
+    """
+    Tests that all the relations of a database are created with a single update.
+    """
+    schema = {
+        "workspace": {"parent_page_id": "test_parent_page_id"},
+        "databases": [
+            {"db_key": "customers", "title": "Customers", "properties": {"Name": {"type": "title"}}},
+            {"db_key": "products", "title": "Products", "properties": {"Name": {"type": "title"}}},
+            {"db_key": "orders", "title": "Orders", "properties": {"Order No": {"type": "title"}}}
+        ],
+        "relations": [
+            {"from_db": "orders", "property_name": "Customer", "to_db": "customers"},
+            {"from_db": "orders", "property_name": "Product", "to_db": "products"}
+        ]
+    }
+    mock_notion_client.search.return_value = {"results": []}
+    mock_notion_client.databases.create.side_effect = lambda **kwargs: {
+        "id": f"{kwargs['title'][0]['text']['content'].lower()}_db_id"
+    }
+
+    apply_schema_to_notion(schema, mock_notion_client, dry_run=False)
+
+    mock_notion_client.databases.update.assert_called_once()
+    update_args = mock_notion_client.databases.update.call_args.kwargs
+    assert update_args['database_id'] == "orders_db_id"
+    assert update_args['properties']['Customer']['relation']['database_id'] == "customers_db_id"
+    assert update_args['properties']['Product']['relation']['database_id'] == "products_db_id"
+
+def test_apply_schema_skips_unchanged_database(mock_notion_client, basic_schema):
+    """
+    Tests that merging a schema the database already satisfies makes no update call.
+    """
+    # Arrange: The existing database has every schema property, plus server-generated fields
+    existing_db = {
+        "id": "existing_db_id",
+        "title": [{"plain_text": "Customers"}],
+        "properties": {
+            "Name": {"id": "title", "name": "Name", "type": "title", "title": {}},
+            "Email": {"id": "abc", "name": "Email", "type": "email", "email": {}},
+            "Notes": {"id": "def", "name": "Notes", "type": "rich_text", "rich_text": {}}
+        }
+    }
+    mock_notion_client.search.return_value = {"results": [existing_db]}
+
+    # Act
+    apply_schema_to_notion(basic_schema, mock_notion_client, dry_run=False)
+
+    # Assert
+    mock_notion_client.databases.update.assert_not_called()
+
+def test_dry_run_validates_properties(mock_notion_client, basic_schema):
+    """
+    Tests that a dry run rejects invalid properties just like a real run.
+    """
+    basic_schema['databases'][0]['properties']['Amount'] = {"type": "number", "format": "doubloons"}
+
+    with pytest.raises(ValueError, match="Invalid number format 'doubloons'"):
+        apply_schema_to_notion(basic_schema, mock_notion_client, dry_run=True)
+
+def test_failed_database_write_stops_before_relations(mock_notion_client):
+    """
+    Tests that every database is attempted, and that relations are not created when one fails.
+    """
+    # Arrange
+    schema = {
+        "workspace": {"parent_page_id": "test_parent_page_id"},
+        "databases": [
+            {"db_key": "customers", "title": "Customers", "properties": {"Name": {"type": "title"}}},
+            {"db_key": "orders", "title": "Orders", "properties": {"Order No": {"type": "title"}}}
+        ],
+        "relations": [{"from_db": "orders", "property_name": "Customer", "to_db": "customers"}]
+    }
+    mock_notion_client.search.return_value = {"results": []}
+
+    def create(**kwargs):
+        title = kwargs['title'][0]['text']['content']
+        if title == "Customers":
+            raise RuntimeError("boom")
+        return {"id": f"{title.lower()}_db_id"}
+    mock_notion_client.databases.create.side_effect = create
+
+    # Act / Assert
+    with pytest.raises(RuntimeError, match="boom"):
+        apply_schema_to_notion(schema, mock_notion_client, dry_run=False)
+    assert mock_notion_client.databases.create.call_count == 2
+    mock_notion_client.databases.update.assert_not_called()
+
+def test_invalid_schema_is_rejected_before_any_api_call(mock_notion_client):
+    """
+    Tests that every schema error is reported together, before anything is sent to Notion.
+    """
+    # Arrange: The first database is valid, the next two are not
+    schema = {
+        "workspace": {"parent_page_id": "test_parent_page_id"},
+        "databases": [
+            {"db_key": "customers", "title": "Customers", "properties": {"Name": {"type": "title"}}},
+            {"db_key": "orders", "title": "Orders", "properties": {"Total": {"type": "number", "format": "doubloons"}}},
+            {"title": "Products", "properties": {"Name": {"type": "title"}}}
+        ]
+    }
+
+    # Act
+    with pytest.raises(ValueError) as excinfo:
+        apply_schema_to_notion(schema, mock_notion_client, dry_run=False)
+
+    # Assert
+    assert "Invalid number format 'doubloons' for property 'Total'" in str(excinfo.value)
+    assert "Database 'Products' is missing a `db_key`." in str(excinfo.value)
+    mock_notion_client.search.assert_not_called()
+    mock_notion_client.databases.create.assert_not_called()
+
+def test_apply_schema_rejects_unsupported_property_type(mock_notion_client, basic_schema):
+    """
+    Tests that a property of an unknown type is reported instead of being left out.
+    """
+    basic_schema['databases'][0]['properties']['Done'] = {"type": "checbox"}
+
+    with pytest.raises(ValueError, match="Unsupported type 'checbox' for property 'Done'"):
+        apply_schema_to_notion(basic_schema, mock_notion_client)
+    mock_notion_client.databases.create.assert_not_called()
+
+def test_invalid_schema_reports_every_invalid_property(mock_notion_client, basic_schema):
+    """
+    Tests that each unsupported or invalid property is listed, not only the first of a database.
+    """
+    basic_schema['databases'][0]['properties'].update({
+        "Done": {"type": "checbox"},
+        "Owner": {"type": "people"},
+        "Total": {"type": "number", "format": "doubloons"},
+    })
+
+    with pytest.raises(ValueError) as excinfo:
+        apply_schema_to_notion(basic_schema, mock_notion_client)
+
+    message = str(excinfo.value)
+    assert "Unsupported type 'checbox' for property 'Done'" in message
+    assert "Unsupported type 'people' for property 'Owner'" in message
+    assert "Invalid number format 'doubloons' for property 'Total'" in message